@@ -1,16 +1,25 @@
 import json
 import os
+import re
+import sys
 import hashlib
+import threading
+import time
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from dotenv import load_dotenv
 from gitlab import Gitlab
 import vertexai
 from vertexai.generative_models import GenerationConfig, GenerativeModel
-from google.cloud import logging as gcp_logging
-from google.cloud.logging.handlers import StructuredLogHandler # Import StructuredLogHandler
 from google.cloud import tasks_v2
 import logging # Import standard logging
-from flask import Flask, request, Response
+from flask import Flask, request, Response, has_request_context
 import traceback # For detailed error logging
+try:
+    import orjson # Faster JSON encoding/decoding for payloads, prompts and Gemini responses
+except ImportError:
+    orjson = None
 
 # --- Global Initializations ---
 
@@ -27,17 +36,57 @@ CLOUD_TASKS_QUEUE_PATH = os.environ.get('CLOUD_TASKS_QUEUE_PATH') # e.g., projec
 CLOUD_TASKS_LOCATION = os.environ.get('CLOUD_TASKS_LOCATION') # e.g., us-central1
 CLOUD_TASKS_QUEUE_NAME = os.environ.get('CLOUD_TASKS_QUEUE_NAME') # e.g., code-analyzer
 SERVICE_ACCOUNT_EMAIL = os.environ.get('SERVICE_ACCOUNT_EMAIL') # Required for Cloud Tasks HTTP target
+TASK_TARGET_URL = os.environ.get('TASK_TARGET_URL') # Optional, e.g. https://SERVICE_URL/process_mr. Derived from the first webhook if unset.
+PROJECT_CACHE_TTL_SECONDS = int(os.environ.get('PROJECT_CACHE_TTL_SECONDS', 60)) # How long fetched GitLab projects are reused
+GITLAB_FETCH_WORKERS = int(os.environ.get('GITLAB_FETCH_WORKERS', 16)) # Concurrent file content fetches per MR
+GITLAB_POST_WORKERS = int(os.environ.get('GITLAB_POST_WORKERS', 8)) # Concurrent discussion posts per MR
 
 # Initialize Flask App
 app = Flask(__name__)
 
 
-# Initialize GCP Logging Client (once)
+class JsonLogHandler(logging.Handler):
+    """
+    Writes each record as a single JSON line to stderr. Cloud Run ingests JSON lines
+    into Cloud Logging as structured entries, so the google-cloud-logging client isn't needed.
+    """
+    def __init__(self, stream=None):
+        super().__init__()
+        self.stream = stream or sys.stderr
+
+    def emit(self, record):
+        try:
+            entry = {
+                "severity": record.levelname,
+                "message": record.getMessage(),
+                "logger": record.name,
+                "logging.googleapis.com/sourceLocation": {
+                    "file": record.pathname,
+                    "line": record.lineno,
+                    "function": record.funcName,
+                },
+            }
+            if record.exc_info:
+                entry["message"] += "\n" + self.formatException(record.exc_info)
+            if PROJECT_ID:
+                trace_header = request.headers.get("X-Cloud-Trace-Context") if has_request_context() else None
+                if trace_header:
+                    entry["logging.googleapis.com/trace"] = f"projects/{PROJECT_ID}/traces/{trace_header.split('/', 1)[0]}"
+            line = orjson.dumps(entry, default=str).decode("utf-8") if orjson is not None else json.dumps(entry, default=str)
+            self.stream.write(line + "\n")
+            self.stream.flush()
+        except Exception:
+            self.handleError(record)
+
+    def formatException(self, exc_info):
+        return logging.Formatter().formatException(exc_info)
+
+# Initialize Logging (once)
 logger = None # Initialize logger to None first
 try:
     if PROJECT_ID:
-        # Use StructuredLogHandler for better integration in GCP environments
-        handler = StructuredLogHandler()
+        # Use JSON lines for structured logging in GCP environments
+        handler = JsonLogHandler()
         # Get the root logger used by Flask/Gunicorn
         root_logger = logging.getLogger()
         root_logger.setLevel(logging.INFO if not DEBUG_MODE else logging.DEBUG) # Set level based on DEBUG_MODE
@@ -46,27 +95,48 @@ try:
             root_logger.removeHandler(h)
         root_logger.addHandler(handler)
         logger = root_logger # Use the configured root logger
-        logger.info("StructuredLogHandler initialized and attached to root logger.")
+        logger.info("JsonLogHandler initialized and attached to root logger.")
     else:
         raise ValueError("PROJECT_ID environment variable not set.")
 except Exception as e:
-    # Fallback logger if GCP client fails
+    # Fallback logger if structured logging setup fails
     logging.basicConfig(level=logging.INFO if not DEBUG_MODE else logging.DEBUG)
     logger = logging.getLogger("code-analyzer-cloudrun-fallback")
-    logger.error(f"Failed to initialize GCP Logging client: {e}. Using standard logger.", exc_info=True)
+    logger.error(f"Failed to initialize structured logging: {e}. Using standard logger.", exc_info=True)
+
+# Initialize GitLab Client (lazily, on first use)
+class _GitlabProxy:
+    """
+    Defers creating and authenticating the GitLab client until first attribute access,
+    so cold starts don't block on a GitLab round-trip before serving requests.
+    """
+    def __init__(self, url, private_token):
+        self._url = url
+        self._private_token = private_token
+        self._client = None
+        self._ready = False
+        self._lock = threading.Lock()
+
+    def _get_client(self):
+        if self._ready:
+            return self._client
+        with self._lock:
+            if not self._ready:
+                client = Gitlab(self._url, private_token=self._private_token)
+                client.auth() # Verify authentication on first use
+                self._client = client
+                self._ready = True
+                logger.info("GitLab client initialized and authenticated successfully.")
+        return self._client
+
+    def __getattr__(self, name):
+        return getattr(self._get_client(), name)
 
-# Initialize GitLab Client (once)
 gl = None # Initialize gl to None
-try:
-    if GITLAB_PAT_SECRET:
-        gl = Gitlab(GITLAB_URL, private_token=GITLAB_PAT_SECRET)
-        gl.auth() # Verify authentication early
-        logger.info("GitLab client initialized and authenticated successfully.")
-    else:
-        logger.warning("GITLAB_PAT_SECRET not found. GitLab client not initialized.")
-except Exception as e:
-    logger.error(f"Error initializing GitLab client: {e}. GitLab features may fail.", exc_info=True)
-    gl = None # Ensure gl is None if initialization fails
+if GITLAB_PAT_SECRET:
+    gl = _GitlabProxy(GITLAB_URL, GITLAB_PAT_SECRET)
+else:
+    logger.warning("GITLAB_PAT_SECRET not found. GitLab client not initialized.")
 
 # Initialize Vertex AI Client (once)
 vertex_ai_initialized = False
@@ -96,40 +166,54 @@ PARSED_DEFAULT_PROMPTS = {
     "summary_user": "Default summary user prompt not loaded."
 }
 
+DEFAULT_PROMPTS_CACHE_PATH = os.environ.get("DEFAULT_PROMPTS_CACHE_PATH", "/tmp/prompts_cache.json")
+
+# Markers used to split default.md into its sections
+# Marker 1: End of summary system instructions, start of review prompt
+PROMPT_MARKER1_TEXT = "The Changes will be provided as a JSON Array of Changes."
+# Marker 2: End of review prompt, start of summary user prompt
+PROMPT_MARKER2_TEXT = "Summarize the following code review comments, which are provided in JSON format:"
+# Extracts all three sections in one pass (compiled once at import)
+_PROMPT_SECTIONS_RE = re.compile(
+    r"(?s)(?P<summary_system>.*?)"
+    r"(?P<review>" + re.escape(PROMPT_MARKER1_TEXT) + r".*?)"
+    r"(?P<summary_user>" + re.escape(PROMPT_MARKER2_TEXT) + r".*)"
+)
+
 def load_and_parse_default_prompts(logger_obj: logging.Logger):
     """Loads and parses the app/prompts/default.md file into distinct prompt sections."""
     global PARSED_DEFAULT_PROMPTS
     default_prompt_path = "prompts/default.md"
     try:
+        source_mtime_ns = os.stat(default_prompt_path).st_mtime_ns
+
+        # Reuse the parsed sections from a previous start if default.md is unchanged
+        try:
+            with open(DEFAULT_PROMPTS_CACHE_PATH, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+            if cached.get("mtime_ns") == source_mtime_ns:
+                PARSED_DEFAULT_PROMPTS.update(cached["prompts"])
+                logger_obj.info(f"Loaded parsed default prompts from cache: {DEFAULT_PROMPTS_CACHE_PATH}")
+                return
+        except (OSError, ValueError, KeyError, AttributeError):
+            pass # Missing or stale cache, parse the source file below
+
         with open(default_prompt_path, "r", encoding="utf-8") as f:
             content = f.read()
         logger_obj.info(f"Successfully loaded default prompt file: {default_prompt_path}")
 
-        # Define markers to split the content
-        # Marker 1: End of summary system instructions, start of review prompt
-        marker1_text = "The Changes will be provided as a JSON Array of Changes."
-        # Marker 2: End of review prompt, start of summary user prompt
-        marker2_text = "Summarize the following code review comments, which are provided in JSON format:"
-
-        parts = content.split(marker1_text, 1)
-        if len(parts) < 2:
-            logger_obj.error(f"Marker 1 ('{marker1_text[:50]}...') not found in {default_prompt_path}. Cannot parse prompts.")
-            return
-
-        summary_system_text = parts[0].strip()
-        remaining_after_marker1 = parts[1]
-
-        parts2 = remaining_after_marker1.split(marker2_text, 1)
-        if len(parts2) < 2:
-            logger_obj.error(f"Marker 2 ('{marker2_text[:50]}...') not found after Marker 1 in {default_prompt_path}. Cannot parse prompts.")
+        match = _PROMPT_SECTIONS_RE.match(content)
+        if not match:
+            if PROMPT_MARKER1_TEXT not in content:
+                logger_obj.error(f"Marker 1 ('{PROMPT_MARKER1_TEXT[:50]}...') not found in {default_prompt_path}. Cannot parse prompts.")
+            else:
+                logger_obj.error(f"Marker 2 ('{PROMPT_MARKER2_TEXT[:50]}...') not found after Marker 1 in {default_prompt_path}. Cannot parse prompts.")
             return
 
-        review_text = (marker1_text + parts2[0]).strip() # Prepend marker1_text as it's part of review prompt
-        summary_user_text = (marker2_text + parts2[1]).strip() # Prepend marker2_text as it's part of summary user prompt
-
-        PARSED_DEFAULT_PROMPTS["summary_system"] = summary_system_text
-        PARSED_DEFAULT_PROMPTS["review"] = review_text
-        PARSED_DEFAULT_PROMPTS["summary_user"] = summary_user_text
+        # Marker 1 starts the review prompt, marker 2 starts the summary user prompt
+        PARSED_DEFAULT_PROMPTS["summary_system"] = match["summary_system"].strip()
+        PARSED_DEFAULT_PROMPTS["review"] = match["review"].strip()
+        PARSED_DEFAULT_PROMPTS["summary_user"] = match["summary_user"].strip()
 
         logger_obj.info("Successfully parsed default prompts from default.md.")
         if DEBUG_MODE:
@@ -137,11 +221,29 @@ def load_and_parse_default_prompts(logger_obj: logging.Logger):
             logger_obj.debug(f"Parsed Summary System (first 100 chars): {PARSED_DEFAULT_PROMPTS['summary_system'][:100]}...")
             logger_obj.debug(f"Parsed Summary User (first 100 chars): {PARSED_DEFAULT_PROMPTS['summary_user'][:100]}...")
 
+        try:
+            with open(DEFAULT_PROMPTS_CACHE_PATH, "w", encoding="utf-8") as f:
+                json.dump({"mtime_ns": source_mtime_ns, "prompts": PARSED_DEFAULT_PROMPTS}, f)
+        except OSError as cache_err:
+            logger_obj.warning(f"Could not write parsed prompts cache {DEFAULT_PROMPTS_CACHE_PATH}: {cache_err}")
+
     except FileNotFoundError:
         logger_obj.error(f"Default prompt file not found: {default_prompt_path}. Using fallback strings.")
     except Exception as e:
         logger_obj.error(f"Failed to load or parse default prompt file {default_prompt_path}: {e}", exc_info=True)
 
+@lru_cache(maxsize=32)
+def _read_project_prompt(project_prompt_path: str) -> str | None:
+    """
+    Reads a project-specific prompt file, or returns None if it doesn't exist.
+    Memoized since prompt files are baked into the container image and don't change at runtime.
+    """
+    try:
+        with open(project_prompt_path, "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
 def get_review_prompt(project_path_with_namespace: str, logger_obj: logging.Logger) -> str:
     """
     Gets the appropriate review prompt.
@@ -153,11 +255,10 @@ def get_review_prompt(project_path_with_namespace: str, logger_obj: logging.Logg
         project_prompt_filename = f"{safe_project_name}.md"
         project_prompt_path = os.path.join("prompts", project_prompt_filename)
 
-        if os.path.exists(project_prompt_path):
-            with open(project_prompt_path, "r", encoding="utf-8") as f:
-                content = f.read()
+        content = _read_project_prompt(project_prompt_path)
+        if content is not None:
             logger_obj.info(f"Using project-specific review prompt for '{project_path_with_namespace}' from {project_prompt_path}")
-            return content.strip()
+            return content
         else:
             logger_obj.info(f"No project-specific review prompt found for '{project_path_with_namespace}'. Using default review prompt.")
             return PARSED_DEFAULT_PROMPTS["review"]
@@ -182,6 +283,77 @@ else: # Should not happen if logger initialization is robust
     fallback_startup_logger.warning("Main logger not available at prompt loading. Using temporary logger.")
     load_and_parse_default_prompts(fallback_startup_logger)
 
+# Constant parts of the Cloud Tasks HTTP request; url and body are added per webhook
+TASK_HTTP_REQUEST_TEMPLATE = {
+    "http_method": tasks_v2.HttpMethod.POST,
+    "headers": {"Content-Type": "application/json"},
+    # OIDC token is needed to authenticate the task request to the Cloud Run service
+    "oidc_token": {
+        "service_account_email": SERVICE_ACCOUNT_EMAIL,
+    },
+}
+
+_task_target_url_lock = threading.Lock()
+
+def get_task_target_url(url_root: str) -> str:
+    """
+    Returns the Cloud Tasks target URL for /process_mr, resolving it from the
+    request's url_root only once per process when TASK_TARGET_URL is not set.
+    """
+    global TASK_TARGET_URL
+    if TASK_TARGET_URL:
+        return TASK_TARGET_URL
+    with _task_target_url_lock:
+        if not TASK_TARGET_URL:
+            # Ensure the URL starts with https for OIDC authenticated tasks
+            TASK_TARGET_URL = url_root.replace("http://", "https://", 1) + "process_mr"
+    return TASK_TARGET_URL
+
+def json_loads(data):
+    """Decodes JSON from bytes or str, using orjson when available."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def json_dumps(obj, indent=False):
+    """Encodes obj as a JSON str, using orjson when available."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0).decode("utf-8")
+    if indent:
+        return json.dumps(obj, indent=2)
+    return json.dumps(obj, separators=(",", ":"))
+
+def json_dumps_array_limited(items, max_chars):
+    """
+    Serializes a list as a JSON array one item at a time, stopping once max_chars is reached
+    so the full document is never built just to be sliced.
+    Returns (text, truncated); truncated text ends with a "... (truncated)" marker.
+    """
+    parts = ["["]
+    total = 1
+    for index, item in enumerate(items):
+        chunk = ("" if index == 0 else ",") + json_dumps(item)
+        if total + len(chunk) > max_chars:
+            parts.append(chunk[:max_chars - total])
+            return "".join(parts) + "\n... (truncated)", True
+        parts.append(chunk)
+        total += len(chunk)
+    parts.append("]")
+    return "".join(parts), False
+
+def json_preview(obj, max_chars=500):
+    """
+    Returns the first max_chars of obj's JSON encoding without serializing the whole object.
+    """
+    chunks = []
+    total = 0
+    for chunk in json.JSONEncoder(default=str).iterencode(obj):
+        chunks.append(chunk)
+        total += len(chunk)
+        if total >= max_chars:
+            break
+    return "".join(chunks)[:max_chars]
+
 # --- End Global Initializations ---
 
 # --- Webhook Endpoint (/webhook) ---
@@ -213,22 +385,25 @@ def webhook_receiver():
         logger.info(f"Unsupported event type: {event_type}. Skipping.")
         return "Unsupported event type", 200 # Acknowledge unsupported events
 
-    # 3. Parse Payload
+    # 3. Parse Payload (raw bytes are kept and forwarded verbatim as the task body)
     try:
-        payload = request.get_json()
+        raw_body = request.get_data(cache=True)
+        payload = json_loads(raw_body) if raw_body else None
         if not payload:
             raise ValueError("Payload is empty or not valid JSON.")
-        mr_iid = payload.get('object_attributes', {}).get('iid', 'N/A')
-        project_id_from_payload = payload.get('project', {}).get('id', 'N/A') # Rename to avoid conflict
+        object_attributes = payload.get('object_attributes') or {}
+        project_attributes = payload.get('project') or {}
+        mr_iid = object_attributes.get('iid', 'N/A')
+        project_id_from_payload = project_attributes.get('id', 'N/A') # Rename to avoid conflict
         logger.info(f"Payload received for MR !{mr_iid} in project {project_id_from_payload}")
         if DEBUG_MODE:
-            logger.debug(f"Payload sample (first 500 chars): {json.dumps(payload)[:500]}...")
+            logger.debug(f"Payload sample (first 500 chars): {json_preview(payload)}...")
     except Exception as e:
         logger.error(f"Failed to parse JSON payload: {e}", exc_info=True)
         if DEBUG_MODE:
             try:
-                raw_body = request.get_data(as_text=True)
-                logger.debug(f"Raw request body on parse failure: {raw_body[:1000]}...")
+                raw_text = request.get_data(as_text=True)
+                logger.debug(f"Raw request body on parse failure: {raw_text[:1000]}...")
             except Exception as read_err:
                 logger.error(f"Failed to read raw request body: {read_err}")
         return "Bad Request: Invalid JSON payload", 400
@@ -247,15 +422,9 @@ def webhook_receiver():
     try:
         task = {
             "http_request": { # Use http_request for Cloud Run targets
-                "http_method": tasks_v2.HttpMethod.POST,
-                # Ensure the URL starts with https for OIDC authenticated tasks
-                "url": request.url_root.replace("http://", "https://", 1) + "process_mr",
-                "headers": {"Content-Type": "application/json"},
-                "body": json.dumps(payload).encode("utf-8"),
-                # OIDC token is needed to authenticate the task request to the Cloud Run service
-                "oidc_token": {
-                    "service_account_email": SERVICE_ACCOUNT_EMAIL,
-                },
+                **TASK_HTTP_REQUEST_TEMPLATE,
+                "url": get_task_target_url(request.url_root),
+                "body": raw_body,
             }
         }
 
@@ -280,14 +449,17 @@ def process_merge_request_task():
 
     # 1. Parse Payload from Task
     try:
-        payload = request.get_json()
+        raw_body = request.get_data(cache=True)
+        payload = json_loads(raw_body) if raw_body else None
         if not payload:
             raise ValueError("Payload is empty or not valid JSON in task.")
-        mr_iid = payload.get('object_attributes', {}).get('iid', 'N/A')
-        project_id_from_payload = payload.get('project', {}).get('id', 'N/A')
+        object_attributes = payload.get('object_attributes') or {}
+        project_attributes = payload.get('project') or {}
+        mr_iid = object_attributes.get('iid', 'N/A')
+        project_id_from_payload = project_attributes.get('id', 'N/A')
         logger.info(f"Processing task for MR !{mr_iid} in project {project_id_from_payload}")
         if DEBUG_MODE:
-            logger.debug(f"Task payload sample (first 500 chars): {json.dumps(payload)[:500]}...")
+            logger.debug(f"Task payload sample (first 500 chars): {json_preview(payload)}...")
     except Exception as e:
         logger.error(f"Failed to parse JSON payload from task: {e}", exc_info=True)
         # Return 500 to signal Cloud Tasks to retry (if configured)
@@ -332,13 +504,15 @@ def handle_merge_request_logic(payload, gl_client, logger_obj):
     """
     project = None
     mr = None
+    merge_request_iid = 'N/A'
     try:
+        object_attributes = payload["object_attributes"]
         project_id = payload["project"]["id"]
-        merge_request_iid = payload["object_attributes"]["iid"]
-        action = payload["object_attributes"]["action"]
+        merge_request_iid = object_attributes["iid"]
+        action = object_attributes["action"]
         logger_obj.info(f"Handling MR {merge_request_iid} in project {project_id}. Action: {action}")
 
-        project = gl_client.projects.get(project_id)
+        project = get_project(gl_client, project_id)
         mr = project.mergerequests.get(merge_request_iid)
         logger_obj.info(f"Fetched project {project.path_with_namespace} and MR !{mr.iid} ('{mr.title}')")
 
@@ -347,7 +521,7 @@ def handle_merge_request_logic(payload, gl_client, logger_obj):
             return
 
         diffs = []
-        if action == "update" and "oldrev" in payload["object_attributes"]:
+        if action == "update" and "oldrev" in object_attributes:
             logger_obj.info(f"MR !{mr.iid} action is 'update'. Performing code review on latest commit.")
             diffs = get_latest_commit_diff(payload, project, logger_obj)
             logger_obj.info(f"Retrieved {len(diffs)} diffs for latest commit.")
@@ -368,13 +542,21 @@ def handle_merge_request_logic(payload, gl_client, logger_obj):
             logger_obj.warning(f"No feedback provided by Gemini for MR !{mr.iid}")
             return
 
-        comments = response.get('responses', [])
+        # Pop so the raw list isn't kept alive by the response dict alongside the deduplicated one
+        comments = response.pop('responses')
         logger_obj.info(f"Received {len(comments)} review responses from Gemini. Processing...")
         comments = deduplicate_gemini_responses(comments, logger_obj)
         logger_obj.info(f"Posting {len(comments)} deduplicated comments for MR !{mr.iid}")
 
-        for line_comment in comments:
-            post_diff_discussion(mr, line_comment, logger_obj)
+        existing_positions = get_existing_discussion_positions(mr, logger_obj)
+        posted_positions = set()
+        positions_lock = threading.Lock()
+        # Each discussion is an independent GitLab round-trip, so overlap them
+        with ThreadPoolExecutor(max_workers=GITLAB_POST_WORKERS) as executor:
+            list(executor.map(
+                lambda line_comment: post_diff_discussion(mr, line_comment, logger_obj, existing_positions, posted_positions, positions_lock),
+                comments
+            ))
 
         response_summary = get_code_review_summary_from_gemini(comments, logger_obj, payload, project, mr)
         if response_summary:
@@ -383,13 +565,29 @@ def handle_merge_request_logic(payload, gl_client, logger_obj):
             logger_obj.warning(f"No summary generated for MR !{mr.iid}")
 
     except Exception as e:
-        logger_obj.error(f"An error occurred during merge request processing for MR !{payload.get('object_attributes', {}).get('iid', 'N/A')}: {e}", exc_info=True)
+        logger_obj.error(f"An error occurred during merge request processing for MR !{merge_request_iid}: {e}", exc_info=True)
         if mr: # If we have the MR object, post a comment
             tb_str = traceback.format_exc()
             post_error_comment_to_mr(mr, tb_str, logger_obj)
         raise # Re-raise the exception to ensure the task fails and can be retried/monitored.
 
 
+@lru_cache(maxsize=128)
+def _get_project_for_bucket(gl_client, project_id, ttl_bucket):
+    """Fetches a project; ttl_bucket is part of the cache key so entries expire."""
+    return gl_client.projects.get(project_id)
+
+
+def get_project(gl_client, project_id):
+    """
+    Returns the GitLab project, reusing a fetch from the last PROJECT_CACHE_TTL_SECONDS.
+    Merge requests are not cached since their state is specific to each event.
+    """
+    if PROJECT_CACHE_TTL_SECONDS <= 0:
+        return gl_client.projects.get(project_id)
+    return _get_project_for_bucket(gl_client, project_id, int(time.time() // PROJECT_CACHE_TTL_SECONDS))
+
+
 def post_error_comment_to_mr(mr, stack_trace, logger_obj):
     """Posts a formatted error message to the merge request."""
     try:
@@ -411,62 +609,83 @@ def post_error_comment_to_mr(mr, stack_trace, logger_obj):
         logger_obj.error(f"Failed to post error comment to MR !{mr.iid}: {e}", exc_info=True)
 
 
+# Review item keys, interned so hot-loop dict lookups hit the identity fast path
+_K_NEW_FILE, _K_NEW_LINE, _K_OLD_LINE, _K_COMMENT = map(sys.intern, ("new_file_path", "new_line", "old_line", "comment"))
+
+_OPTIONAL_INT_TYPES = (int, type(None))
+
 def deduplicate_gemini_responses(responses, logger_obj):
     """
     Deduplicates Gemini responses by selecting the most comprehensive comment for each line.
     """
-    best_comments = {}
-    logger_obj.info(f"Deduplicating {len(responses)} responses from Gemini")
+    # location_key -> (comment length, response)
+    best_comments: dict[tuple, tuple[int, dict]] = {}
+    logger_obj.info("Deduplicating %s responses from Gemini", len(responses))
 
     for response in responses:
         # Ensure response is a dictionary and has expected keys
         if not isinstance(response, dict):
-            logger_obj.warning(f"Skipping non-dictionary item during deduplication: {response}")
+            logger_obj.warning("Skipping non-dictionary item during deduplication: %s", response)
             continue
 
-        new_file_path = response.get('new_file_path', '')
-        new_line = response.get('new_line', -1)
-        old_line = response.get('old_line', -1)
-        comment_text = response.get('comment', '')
+        new_file_path = response.get(_K_NEW_FILE, '')
+        new_line = response.get(_K_NEW_LINE, -1)
+        old_line = response.get(_K_OLD_LINE, -1)
+        comment_text = response.get(_K_COMMENT, '')
 
         # Validate types
-        if not all([
-            isinstance(new_file_path, str),
-            isinstance(new_line, (int, type(None))),
-            isinstance(old_line, (int, type(None))),
-            isinstance(comment_text, str)
-        ]):
-             logger_obj.warning(f"Skipping item with invalid types during deduplication: {response}")
+        if not (isinstance(new_file_path, str) and
+                isinstance(new_line, _OPTIONAL_INT_TYPES) and
+                isinstance(old_line, _OPTIONAL_INT_TYPES) and
+                isinstance(comment_text, str)):
+             logger_obj.warning("Skipping item with invalid types during deduplication: %s", response)
              continue
 
         location_key = (new_file_path, new_line, old_line)
+        comment_len = len(comment_text)
         existing = best_comments.get(location_key)
 
-        if not existing or len(comment_text) > len(existing.get('comment', '')):
-            best_comments[location_key] = response
+        if existing is None or comment_len > existing[0]:
+            best_comments[location_key] = (comment_len, response)
             if DEBUG_MODE:
-                logger_obj.debug(f"Selected comment for {location_key}: {comment_text[:100]}...")
+                logger_obj.debug("Selected comment for %s: %s...", location_key, comment_text[:100])
 
-    deduplicated = list(best_comments.values())
-    logger_obj.info(f"Deduplicated to {len(deduplicated)} responses")
+    deduplicated = [response for _, response in best_comments.values()]
+    logger_obj.info("Deduplicated to %s responses", len(deduplicated))
     return deduplicated
 
 
+def _coerce_line(value):
+    """Coerces a line number to a non-negative int, or None if it isn't one."""
+    if type(value) is int: # Common case: Gemini returned an integer
+        return value if value >= 0 else None
+    if isinstance(value, str):
+        return int(value) if value.isdigit() else None
+    if isinstance(value, float) and value.is_integer() and value >= 0:
+        return int(value)
+    return None
+
+
+def _positive_line(value):
+    """Returns value as a 1-based line number, or None if it isn't a positive integer."""
+    return int(value) if isinstance(value, int) and value > 0 else None
+
+
 def build_position(review_item, mr, logger_obj):
     """Builds a position object for a thread based on the review item."""
-    new_line = review_item.get('new_line')
-    old_line = review_item.get('old_line')
-    new_file_path = review_item.get('new_file_path')
+    new_line = review_item.get(_K_NEW_LINE)
+    old_line = review_item.get(_K_OLD_LINE)
+    new_file_path = review_item.get(_K_NEW_FILE)
     old_file_path = review_item.get('old_file_path', new_file_path)
 
     if not new_file_path:
         return None
 
-    new_line = int(new_line) if isinstance(new_line, (int, float, str)) and str(new_line).isdigit() else None
-    old_line = int(old_line) if isinstance(old_line, (int, float, str)) and str(old_line).isdigit() else None
+    new_line = _coerce_line(new_line)
+    old_line = _coerce_line(old_line)
 
     if not hasattr(mr, 'diff_refs') or not mr.diff_refs:
-        logger_obj.warning(f"Missing diff_refs on MR object !{mr.iid}. Cannot build precise position.")
+        logger_obj.warning("Missing diff_refs on MR object !%s. Cannot build precise position.", mr.iid)
         return None
 
     base_sha = mr.diff_refs.get('base_sha')
@@ -474,7 +693,7 @@ def build_position(review_item, mr, logger_obj):
     start_sha = mr.diff_refs.get('start_sha')
 
     if not base_sha or not head_sha or not start_sha:
-        logger_obj.warning(f"Missing SHA values in diff_refs for MR !{mr.iid}. Cannot build precise position.")
+        logger_obj.warning("Missing SHA values in diff_refs for MR !%s. Cannot build precise position.", mr.iid)
         return None
 
     position = {
@@ -494,23 +713,54 @@ def build_position(review_item, mr, logger_obj):
         position['old_line'] = old_line
         line_range_str = f"old_{old_line}"
     else:
-        orig_new_line = review_item.get('new_line')
-        orig_old_line = review_item.get('old_line')
-        logger_obj.warning(f"No valid line numbers (new_line={orig_new_line}, old_line={orig_old_line}) for position in {new_file_path}, MR !{mr.iid}.")
+        orig_new_line = review_item.get(_K_NEW_LINE)
+        orig_old_line = review_item.get(_K_OLD_LINE)
+        logger_obj.warning("No valid line numbers (new_line=%s, old_line=%s) for position in %s, MR !%s.", orig_new_line, orig_old_line, new_file_path, mr.iid)
         return None
 
     return position
 
 
-def post_diff_discussion(mr, line_comment, logger_obj):
+def position_key(position):
+    """Returns the hashable key used to compare discussion positions."""
+    return (position.get('new_path'), position.get('old_path'), position.get('new_line'), position.get('old_line'))
+
+
+def get_existing_discussion_positions(mr, logger_obj):
+    """
+    Builds a frozenset of the positions of existing text discussions on the MR,
+    keyed by (new_path, old_path, new_line, old_line). Fetched once per MR so
+    each comment can be checked for duplicates with a single set lookup.
+    """
+    try:
+        # Fetch all discussions for the MR, lazily paginated.
+        # Note: Lines are 1-based in both GitLab positions and built positions.
+        # SHAs are intentionally not compared, they change with rebases/updates.
+        existing_positions = frozenset(
+            position_key(existing_disc.position)
+            for existing_disc in mr.discussions.list(get_all=True, iterator=True)
+            if getattr(existing_disc, 'position', None) and existing_disc.position.get('position_type') == 'text'
+        )
+        logger_obj.info("Indexed %s existing discussion positions for MR !%s", len(existing_positions), mr.iid)
+        return existing_positions
+    except Exception as check_err:
+        # Log the error but proceed with an empty index to avoid losing comments due to a check failure
+        logger_obj.error("Error fetching existing discussions for MR !%s: %s. Duplicate check disabled.", mr.iid, check_err, exc_info=True)
+        return frozenset()
+
+
+def post_diff_discussion(mr, line_comment, logger_obj, existing_positions=frozenset(), posted_positions=None, positions_lock=None):
     """
     Posts a code review comment as a discussion on a specific line.
+    Skips positions present in existing_positions or already posted during this run,
+    and records newly posted ones in posted_positions.
+    positions_lock guards posted_positions when posting from multiple threads.
     """
     try:
-        comment_text = line_comment.get('comment', '').strip()
-        file_path = line_comment.get('new_file_path', 'unknown file')
-        new_line_num = line_comment.get('new_line', -1) # Keep as -1 if missing
-        old_line_num = line_comment.get('old_line', -1) # Keep as -1 if missing
+        comment_text = line_comment.get(_K_COMMENT, '').strip()
+        file_path = line_comment.get(_K_NEW_FILE, 'unknown file')
+        new_line_num = line_comment.get(_K_NEW_LINE, -1) # Keep as -1 if missing
+        old_line_num = line_comment.get(_K_OLD_LINE, -1) # Keep as -1 if missing
 
         # Determine display line more robustly (using 1-based numbers or None)
         display_line = 'N/A'
@@ -520,43 +770,24 @@ def post_diff_discussion(mr, line_comment, logger_obj):
             display_line = f"old:{old_line_num}"
 
         if not comment_text:
-            logger_obj.warning(f"Skipping empty comment for {file_path} line ~{display_line} in MR !{mr.iid}")
+            logger_obj.warning("Skipping empty comment for %s line ~%s in MR !%s", file_path, display_line, mr.iid)
             return
 
         target_position = build_position(line_comment, mr, logger_obj)
 
         if target_position:
             # --- Check for existing discussions at the same position ---
-            try:
-                # Fetch all discussions for the MR. Use get_all=True for pagination.
-                existing_discussions = mr.discussions.list(get_all=True)
-                found_existing = False
-                for existing_disc in existing_discussions:
-                    # Ensure the existing discussion has a position and it's 'text' type
-                    # Also check if it's an active discussion (not resolved, though API might not filter easily)
-                    if hasattr(existing_disc, 'position') and existing_disc.position and existing_disc.position.get('position_type') == 'text':
-                        existing_pos = existing_disc.position
-                        # Compare relevant position attributes (paths and lines)
-                        # Note: Lines in target_position and existing_pos should both be 1-based
-                        if (target_position.get('new_path') == existing_pos.get('new_path') and
-                            target_position.get('old_path') == existing_pos.get('old_path') and
-                            target_position.get('new_line') == existing_pos.get('new_line') and
-                            target_position.get('old_line') == existing_pos.get('old_line')):
-                            # Optional: Add SHA comparison here if needed for more precision,
-                            # but be aware SHAs might change with rebases/updates.
-                            # and target_position.get('base_sha') == existing_pos.get('base_sha')
-                            # and target_position.get('head_sha') == existing_pos.get('head_sha')
-                            # and target_position.get('start_sha') == existing_pos.get('start_sha')):
-
-                            logger_obj.info(f"Discussion already exists at position {file_path}:{display_line} (Discussion ID: {existing_disc.id}). Skipping duplicate post for MR !{mr.iid}.")
-                            found_existing = True
-                            break # Stop checking once a match is found
-
-                if found_existing:
-                    return # Skip posting the new discussion if a duplicate was found
-            except Exception as check_err:
-                # Log the error but proceed with posting to avoid losing the comment due to a check failure
-                logger_obj.error(f"Error checking for existing discussions for MR !{mr.iid} at {file_path}:{display_line}: {check_err}. Proceeding to post comment.", exc_info=True)
+            target_key = position_key(target_position)
+            if target_key in existing_positions:
+                logger_obj.info("Discussion already exists at position %s:%s. Skipping duplicate post for MR !%s.", file_path, display_line, mr.iid)
+                return
+            if posted_positions is not None:
+                # Reserve the position up front so concurrent posts can't duplicate it
+                with positions_lock or nullcontext():
+                    if target_key in posted_positions:
+                        logger_obj.info("Discussion already posted at position %s:%s. Skipping duplicate post for MR !%s.", file_path, display_line, mr.iid)
+                        return
+                    posted_positions.add(target_key)
             # --- End check for existing discussions ---
 
             # If no existing discussion was found (or check failed), proceed to post
@@ -565,14 +796,20 @@ def post_diff_discussion(mr, line_comment, logger_obj):
             truncated_comment = (comment_text[:max_comment_length] + '...') if len(comment_text) > max_comment_length else comment_text
 
             # Post the new discussion
-            result = mr.discussions.create({
-                'body': truncated_comment,
-                'position': target_position # Use the built position
-            })
-            logger_obj.info(f"Posted new discussion {result.id} for line {display_line} in {file_path} (MR !{mr.iid})")
+            try:
+                result = mr.discussions.create({
+                    'body': truncated_comment,
+                    'position': target_position # Use the built position
+                })
+            except Exception:
+                if posted_positions is not None:
+                    with positions_lock or nullcontext():
+                        posted_positions.discard(target_key) # Release the reservation
+                raise
+            logger_obj.info("Posted new discussion %s for line %s in %s (MR !%s)", result.id, display_line, file_path, mr.iid)
         else:
             # Handle case where position couldn't be built (post as general note)
-            logger_obj.warning(f"Could not build valid position for comment on {file_path} line ~{display_line}. Posting general note instead for MR !{mr.iid}")
+            logger_obj.warning("Could not build valid position for comment on %s line ~%s. Posting general note instead for MR !%s", file_path, display_line, mr.iid)
             note_body = f"**Code Issue in `{file_path}` (Line ~{display_line})**\n\n{comment_text}"
             # Truncate note body as well
             max_note_length = 15000
@@ -581,10 +818,49 @@ def post_diff_discussion(mr, line_comment, logger_obj):
 
     except Exception as e:
         # Log specific details if available
-        file_info = line_comment.get('new_file_path', 'unknown_file')
-        line_info = f"new:{line_comment.get('new_line', 'N/A')}/old:{line_comment.get('old_line', 'N/A')}"
-        logger_obj.error(f"Error posting code review discussion for MR !{mr.iid} on {file_info} ({line_info}): {e}", exc_info=True)
-
+        file_info = line_comment.get(_K_NEW_FILE, 'unknown_file')
+        line_info = f"new:{line_comment.get(_K_NEW_LINE, 'N/A')}/old:{line_comment.get(_K_OLD_LINE, 'N/A')}"
+        logger_obj.error("Error posting code review discussion for MR !%s on %s (%s): %s", mr.iid, file_info, line_info, e, exc_info=True)
+
+
+# GenerativeModel instances reused across requests, keyed by their configuration
+_GENERATIVE_MODEL_CACHE: dict[tuple, GenerativeModel] = {}
+_GENERATIVE_MODEL_CACHE_LOCK = threading.Lock()
+
+def get_generative_model(key, factory):
+    """Returns the cached GenerativeModel for key, creating it with factory() on first use."""
+    model = _GENERATIVE_MODEL_CACHE.get(key)
+    if model is None:
+        with _GENERATIVE_MODEL_CACHE_LOCK:
+            model = _GENERATIVE_MODEL_CACHE.get(key)
+            if model is None:
+                model = _GENERATIVE_MODEL_CACHE[key] = factory()
+    return model
+
+
+# JSON schema enforced on Gemini code review responses (built once at import)
+RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "responses": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "new_line": {"type": "integer", "description": "1-based line number in the new file. May be omitted or null."},
+                    "old_line": {"type": "integer", "description": "1-based line number in the old file. May be omitted or null."},
+                    "new_file_path": {"type": "string", "description": "Path of the file being changed."},
+                    "old_file_path": {"type": "string", "description": "Original path of the file if renamed, otherwise same as new_file_path."},
+                    "full_file_content": {"type": "string", "description": "The full content of the new file to provide context for the review."},
+                    "comment": {"type": "string", "description": "The code review comment."},
+                    "severity": {"type": "string", "description": "Severity suggestion (e.g., INFO, WARNING, ERROR)"}
+                },
+                "required": ["new_file_path", "comment", "severity"]
+            }
+        }
+    },
+    "required": ["responses"]
+}
 
 def get_code_review_response_from_gemini(diffs, logger_obj, payload, project, mr):
     """
@@ -598,56 +874,26 @@ def get_code_review_response_from_gemini(diffs, logger_obj, payload, project, mr
         logger_obj.warning(f"No diffs provided to get_code_review_response_from_gemini for MR !{mr.iid}.")
         return {"responses": []}
 
-    output_response_schema = {
-        "type": "object",
-        "properties": {
-            "responses": {
-                "type": "array",
-                "items": {
-                    "type": "object",
-                    "properties": {
-                        "new_line": {"type": "integer", "description": "1-based line number in the new file. May be omitted or null."},
-                        "old_line": {"type": "integer", "description": "1-based line number in the old file. May be omitted or null."},
-                        "new_file_path": {"type": "string", "description": "Path of the file being changed."},
-                        "old_file_path": {"type": "string", "description": "Original path of the file if renamed, otherwise same as new_file_path."},
-                        "full_file_content": {"type": "string", "description": "The full content of the new file to provide context for the review."},
-                        "comment": {"type": "string", "description": "The code review comment."},
-                        "severity": {"type": "string", "description": "Severity suggestion (e.g., INFO, WARNING, ERROR)"}
-                    },
-                    "required": ["new_file_path", "comment", "severity"]
-                }
-            }
-        },
-         "required": ["responses"]
-    }
-
     project_path = project.path_with_namespace
     review_prompt_text = get_review_prompt(project_path, logger_obj)
 
     # --- Data Preparation and Sanitization ---
-    # Create a deep copy to avoid modifying the original list of diffs
-    diffs_for_prompt = json.loads(json.dumps(diffs))
+    # Shallow-copy each diff without full_file_content so the original list of diffs isn't
+    # modified; only top-level keys are reassigned below, so sharing values is safe.
+    diffs_for_prompt = [{k: v for k, v in diff.items() if k != 'full_file_content'} for diff in diffs]
 
-    # Remove the full_file_content from the diffs before sending to Gemini
-    # and ensure all content is string, not bytes.
+    # Ensure all content is string, not bytes.
     for diff in diffs_for_prompt:
-        if 'full_file_content' in diff:
-            del diff['full_file_content']
         # Ensure 'diff' content is decoded if it's bytes
         if 'diff' in diff and isinstance(diff['diff'], bytes):
-            try:
-                diff['diff'] = diff['diff'].decode('utf-8')
-            except UnicodeDecodeError:
-                logger_obj.warning(f"Could not decode diff content for {diff.get('new_path')}. Skipping this part of the diff.")
-                diff['diff'] = "[Content could not be decoded]"
-
+            # Undecodable bytes become U+FFFD instead of raising
+            diff['diff'] = diff['diff'].decode('utf-8', errors='replace')
 
     try:
         max_diff_chars = 50000
-        diffs_json = json.dumps(diffs_for_prompt, indent=2)
-        if len(diffs_json) > max_diff_chars:
-            logger_obj.warning(f"Diff JSON size ({len(diffs_json)} chars) exceeds limit ({max_diff_chars}) for MR !{mr.iid}. Truncating.")
-            diffs_json = diffs_json[:max_diff_chars] + "\n... (truncated)"
+        diffs_json, truncated = json_dumps_array_limited(diffs_for_prompt, max_diff_chars)
+        if truncated:
+            logger_obj.warning(f"Diff JSON size exceeds limit ({max_diff_chars} chars) for MR !{mr.iid}. Truncating.")
     except TypeError as e:
         logger_obj.error(f"TypeError during JSON serialization for prompt: {e}", exc_info=True)
         # This is where the bytes issue would likely be caught.
@@ -671,43 +917,47 @@ Review the following code changes presented as a JSON array of diff objects. Pro
     logger_obj.info(f"Number of diffs sent to Gemini for MR !{mr.iid}: {len(diffs_for_prompt)}")
 
     try:
-        model = GenerativeModel(
-            model_name=MODEL_ID,
-            generation_config=GenerationConfig(
-                response_mime_type="application/json",
-                response_schema=output_response_schema,
-                candidate_count=1,
+        model = get_generative_model(
+            ("review", MODEL_ID),
+            lambda: GenerativeModel(
+                model_name=MODEL_ID,
+                generation_config=GenerationConfig(
+                    response_mime_type="application/json",
+                    response_schema=RESPONSE_SCHEMA,
+                    candidate_count=1,
+                )
             )
         )
         response = model.generate_content(final_prompt)
 
-        if not response.candidates or not response.candidates[0].content or not response.candidates[0].content.parts:
-            finish_reason = getattr(response.candidates[0], 'finish_reason', 'N/A') if response.candidates else 'N/A'
-            safety_ratings = getattr(response.candidates[0], 'safety_ratings', 'N/A') if response.candidates else 'N/A'
+        candidate = response.candidates[0] if response.candidates else None
+        content = candidate.content if candidate is not None else None
+        if not content or not content.parts:
+            finish_reason = getattr(candidate, 'finish_reason', 'N/A')
+            safety_ratings = getattr(candidate, 'safety_ratings', 'N/A')
             error_message = f"Invalid response from Gemini for MR !{mr.iid}. Finish Reason: {finish_reason}, Safety Ratings: {safety_ratings}"
             logger_obj.error(error_message)
             raise RuntimeError(error_message)
 
-        response_text = response.candidates[0].content.parts[0].text
+        response_text = content.parts[0].text
         if DEBUG_MODE:
             logger_obj.debug(f"Full raw Gemini review response for MR !{mr.iid}: {response_text}")
 
-        comments = json.loads(response_text)
+        # orjson reads the str's UTF-8 buffer directly; encoding to bytes first would only add a copy.
+        # (The Vertex AI SDK exposes no pre-parsed response for schema-constrained output.)
+        comments = json_loads(response_text)
 
         if 'responses' not in comments or not isinstance(comments['responses'], list):
             logger_obj.error(f"Gemini response missing 'responses' array for MR !{mr.iid}. Raw text: {response_text}")
             return {"responses": []}
 
-        validated_responses = []
-        for item in comments['responses']:
-            if isinstance(item, dict):
-                nl = item.get('new_line')
-                ol = item.get('old_line')
-                item['new_line'] = int(nl) if isinstance(nl, int) and nl > 0 else None
-                item['old_line'] = int(ol) if isinstance(ol, int) and ol > 0 else None
-                validated_responses.append(item)
-            else:
-                logger_obj.warning(f"Skipping non-dictionary item in Gemini 'responses' array: {item}")
+        raw_responses = comments['responses']
+        validated_responses = [
+            dict(item, new_line=_positive_line(item.get(_K_NEW_LINE)), old_line=_positive_line(item.get(_K_OLD_LINE)))
+            for item in raw_responses if isinstance(item, dict)
+        ]
+        if len(validated_responses) < len(raw_responses):
+            logger_obj.warning(f"Skipping {len(raw_responses) - len(validated_responses)} non-dictionary items in Gemini 'responses' array.")
         comments['responses'] = validated_responses
 
         logger_obj.info(f"Parsed Gemini response successfully for MR !{mr.iid}. Found {len(comments['responses'])} comments.")
@@ -744,6 +994,43 @@ def post_merge_request_summary(mr, feedback, logger_obj):
         logger_obj.error(f"Error posting code review summary for MR !{mr.iid}: {e}", exc_info=True)
 
 
+def attach_full_file_contents(diffs, project, ref, ref_label, logger_obj):
+    """
+    Decodes each diff's 'diff' content to a string and attaches the full file content at ref
+    as 'full_file_content'. File contents are fetched concurrently since each is an
+    independent GitLab round-trip.
+    """
+    to_fetch = []
+    for diff in diffs:
+        # Decode the 'diff' content from bytes to string
+        if 'diff' in diff and isinstance(diff['diff'], bytes):
+            # Undecodable bytes (e.g. binary files) become U+FFFD instead of raising
+            diff['diff'] = diff['diff'].decode('utf-8', errors='replace')
+
+        if diff.get('deleted_file'):
+            diff['full_file_content'] = "" # Use empty string for deleted files
+        else:
+            to_fetch.append(diff)
+
+    if not to_fetch:
+        return
+
+    def fetch_content(diff):
+        file_path = diff.get('new_path')
+        try:
+            file_content = project.files.get(file_path=file_path, ref=ref).content
+            if isinstance(file_content, bytes):
+                diff['full_file_content'] = file_content.decode('utf-8', errors='replace')
+            else:
+                diff['full_file_content'] = file_content
+        except Exception as file_err:
+            logger_obj.error(f"Failed to fetch content for '{file_path}' from {ref_label}: {file_err}", exc_info=True)
+            diff['full_file_content'] = f"Error: Could not retrieve content for {file_path}."
+
+    with ThreadPoolExecutor(max_workers=min(GITLAB_FETCH_WORKERS, len(to_fetch))) as executor:
+        list(executor.map(fetch_content, to_fetch))
+
+
 def get_latest_commit_diff(payload, project, logger_obj):
     """
     Fetches the diff for the latest commit in a GitLab merge request and enriches
@@ -751,7 +1038,8 @@ def get_latest_commit_diff(payload, project, logger_obj):
     """
     commit_id = None
     try:
-        commit_id = payload.get("object_attributes", {}).get("last_commit", {}).get("id")
+        last_commit = (payload.get("object_attributes") or {}).get("last_commit") or {}
+        commit_id = last_commit.get("id")
         if not commit_id:
             logger_obj.error("Invalid payload: last_commit ID is missing or empty.")
             return []
@@ -762,30 +1050,7 @@ def get_latest_commit_diff(payload, project, logger_obj):
         diff_list = commit.diff()
         logger_obj.info(f"Retrieved {len(diff_list)} diffs from commit {commit_id[:8]}")
 
-        for diff in diff_list:
-            # Decode the 'diff' content from bytes to string
-            if 'diff' in diff and isinstance(diff['diff'], bytes):
-                try:
-                    diff['diff'] = diff['diff'].decode('utf-8')
-                except UnicodeDecodeError:
-                    logger_obj.warning(f"Could not decode diff content for {diff.get('new_path')}. Storing as placeholder.")
-                    diff['diff'] = "[Content could not be decoded]"
-
-            if diff.get('deleted_file'):
-                diff['full_file_content'] = "" # Use empty string for deleted files
-                continue
-
-            file_path = diff.get('new_path')
-            try:
-                file_content = project.files.get(file_path=file_path, ref=commit_id).content
-                if isinstance(file_content, bytes):
-                    diff['full_file_content'] = file_content.decode('utf-8')
-                else:
-                    diff['full_file_content'] = file_content
-            except Exception as file_err:
-                logger_obj.error(f"Failed to fetch content for '{file_path}' at commit {commit_id[:8]}: {file_err}", exc_info=True)
-                diff['full_file_content'] = f"Error: Could not retrieve content for {file_path}."
-
+        attach_full_file_contents(diff_list, project, commit_id, f"commit {commit_id[:8]}", logger_obj)
         return diff_list
     except Exception as e:
         commit_id_str = commit_id[:8] if commit_id else "unknown"
@@ -811,9 +1076,12 @@ def get_code_review_summary_from_gemini(responses, logger_obj, payload, project,
     logger_obj.info(f"Number of responses being summarized for MR !{mr.iid}: {len(responses)}")
 
     try:
-        model = GenerativeModel(
-            model_name= MODEL_ID,
-            system_instruction=summary_system_text
+        model = get_generative_model(
+            ("summary", MODEL_ID, summary_system_text),
+            lambda: GenerativeModel(
+                model_name=MODEL_ID,
+                system_instruction=summary_system_text
+            )
         )
     except Exception as e:
         logger_obj.error(f"Failed to initialize GenerativeModel for summary: {e}", exc_info=True)
@@ -821,14 +1089,19 @@ def get_code_review_summary_from_gemini(responses, logger_obj, payload, project,
 
     try:
         # Prepare responses for the prompt, maybe simplify them
-        simplified_responses = [{"comment": r.get("comment", ""), "severity": r.get("severity", ""), "file": r.get("new_file_path", "")} for r in responses]
-        responses_json = json.dumps(simplified_responses, indent=2)
-
-        # Limit size of JSON sent for summary
+        # Limit size of JSON sent for summary by whole records, so the JSON stays valid
         max_summary_input_chars = 10000
-        if len(responses_json) > max_summary_input_chars:
-             logger_obj.warning(f"Responses JSON size ({len(responses_json)} chars) exceeds summary limit ({max_summary_input_chars}). Truncating.")
-             responses_json = responses_json[:max_summary_input_chars] + "\n... (truncated)"
+        simplified_responses = []
+        running_len = 2 # Enclosing brackets
+        for r in responses:
+            item = {"comment": r.get("comment", ""), "severity": r.get("severity", ""), "file": r.get("new_file_path", "")}
+            running_len += len(json_dumps(item)) + 1 # Item plus separator
+            if running_len > max_summary_input_chars:
+                break
+            simplified_responses.append(item)
+        if len(simplified_responses) < len(responses):
+            logger_obj.warning(f"Responses JSON exceeds summary limit ({max_summary_input_chars} chars). Summarizing first {len(simplified_responses)} of {len(responses)} responses.")
+        responses_json = json_dumps(simplified_responses)
 
         # Ensure the placeholder exists before formatting
         if '{json.dumps(responses, indent=2)}' in summary_user_prompt:
@@ -856,14 +1129,16 @@ def get_code_review_summary_from_gemini(responses, logger_obj, payload, project,
         if not response.candidates:
             logger_obj.error("Invalid summary response structure from Gemini: No candidates found.")
             return None
-        if not response.candidates[0].content or not response.candidates[0].content.parts:
+        candidate = response.candidates[0]
+        content = candidate.content
+        if not content or not content.parts:
              logger_obj.error("Invalid summary response structure from Gemini: Missing content or parts in candidate.")
-             finish_reason = getattr(response.candidates[0], 'finish_reason', 'N/A')
-             safety_ratings = getattr(response.candidates[0], 'safety_ratings', 'N/A')
+             finish_reason = getattr(candidate, 'finish_reason', 'N/A')
+             safety_ratings = getattr(candidate, 'safety_ratings', 'N/A')
              logger_obj.error(f"Finish Reason: {finish_reason}, Safety Ratings: {safety_ratings}")
              return None
 
-        summary_text = response.candidates[0].content.parts[0].text.strip()
+        summary_text = content.parts[0].text.strip()
 
         if not summary_text:
              logger_obj.warning(f"Gemini returned an empty summary for MR !{mr.iid}.")
@@ -892,30 +1167,7 @@ def get_merge_diffs(mr, project, logger_obj):
         diffs = changes.get('changes', [])
         logger_obj.info(f"Retrieved {len(diffs)} total diffs for MR !{mr.iid}")
 
-        for diff in diffs:
-            # Decode the 'diff' content from bytes to string
-            if 'diff' in diff and isinstance(diff['diff'], bytes):
-                try:
-                    diff['diff'] = diff['diff'].decode('utf-8')
-                except UnicodeDecodeError:
-                    logger_obj.warning(f"Could not decode diff content for {diff.get('new_path')}. Storing as placeholder.")
-                    diff['diff'] = "[Content could not be decoded]"
-
-            if diff.get('deleted_file'):
-                diff['full_file_content'] = "" # Use empty string for deleted files
-                continue
-
-            file_path = diff.get('new_path')
-            try:
-                file_content = project.files.get(file_path=file_path, ref=source_branch).content
-                if isinstance(file_content, bytes):
-                    diff['full_file_content'] = file_content.decode('utf-8')
-                else:
-                    diff['full_file_content'] = file_content
-            except Exception as file_err:
-                logger_obj.error(f"Failed to fetch content for '{file_path}' from branch '{source_branch}': {file_err}", exc_info=True)
-                diff['full_file_content'] = f"Error: Could not retrieve content for {file_path}."
-
+        attach_full_file_contents(diffs, project, source_branch, f"branch '{source_branch}'", logger_obj)
         return diffs
     except Exception as e:
         logger_obj.error(f"Error fetching all diffs for MR !{mr.iid}: {e}", exc_info=True)
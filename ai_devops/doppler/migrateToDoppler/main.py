@@ -2,15 +2,27 @@ import gitlab
 import json
 import os
 import argparse
+import functools
+import hashlib
 import warnings
 from google.cloud import storage
 import sys
 import time
 import requests
+try:
+    import orjson # Faster backup serialization
+except ImportError:
+    orjson = None
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
 
 # Suppress google-crc32c warnings
 warnings.simplefilter("ignore", RuntimeWarning)
 
+# Number of concurrent GitLab/Doppler API calls
+MAX_WORKERS = 8
+DOPPLER_ENVIRONMENTS = ["dev", "stg", "prd"]
+
 # Parse arguments
 def parse_args():
     parser = argparse.ArgumentParser(description="Backup, upload, delete, and restore GitLab secrets for both projects and groups.")
@@ -25,6 +37,18 @@ def parse_args():
     parser.add_argument("--restore-secrets", action="store_true", help="Restore secrets from the backup file")
     return parser.parse_args()
 
+def create_http_session():
+    """
+    Create a pooled HTTP session shared by the GitLab client and Doppler API calls,
+    so keep-alive connections are reused instead of opening one per request.
+    Auth headers are passed per request so tokens are only sent to their own API.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=16, pool_maxsize=16)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
 def generate_doppler_config_name(gitlab_path, getParent=False):
     if getParent:
         full_path = gitlab_path.split('/')[-2] if '/' in gitlab_path else gitlab_path
@@ -41,7 +65,7 @@ def generate_doppler_config_name(gitlab_path, getParent=False):
 
     return f"gitlab-{full_path}"
 
-def check_or_create_doppler_project(project_name, doppler_token):
+def check_or_create_doppler_project(project_name, doppler_token, session):
     """
     Check if a Doppler project exists, and create it if not.
     """
@@ -49,7 +73,7 @@ def check_or_create_doppler_project(project_name, doppler_token):
     headers = {"Authorization": f"Bearer {doppler_token}"}
 
     # Check existing projects
-    response = requests.get(url, headers=headers)
+    response = session.get(url, headers=headers)
     response.raise_for_status()
     projects = response.json()["projects"]
 
@@ -58,13 +82,13 @@ def check_or_create_doppler_project(project_name, doppler_token):
     else:
         # Create the project if it doesn't exist
         payload = {"name": project_name}
-        create_response = requests.post(url, json=payload, headers=headers)
+        create_response = session.post(url, json=payload, headers=headers)
         create_response.raise_for_status()
         print(f"Created Doppler project '{project_name}'.")
 
-def get_gitlab_entity(gitlab_url, gitlab_token, gitlab_id, entity_type):
+def get_gitlab_entity(gitlab_url, gitlab_token, gitlab_id, entity_type, session=None):
     try:
-        gl = gitlab.Gitlab(gitlab_url, private_token=gitlab_token)
+        gl = gitlab.Gitlab(gitlab_url, private_token=gitlab_token, session=session)
         if entity_type == "project":
             return gl.projects.get(gitlab_id)
         else:
@@ -95,10 +119,14 @@ def backup_secrets(entity, entity_type):
             }
         )
     file_name = f"{entity.name}_{entity.id}_secrets.json"
-    with open(file_name, "w") as f:
-        json.dump(data, f, indent=4)
+    if orjson is not None:
+        with open(file_name, "wb") as f:
+            f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+    else:
+        with open(file_name, "w") as f:
+            json.dump(data, f, indent=2)
     print(f"Backup completed and saved to {file_name}")
-    return file_name
+    return file_name, secrets
 
 
 def download_from_gcs(file_name, bucket_name, bucket_path):
@@ -123,10 +151,21 @@ def delete_all_secrets(entity, bucket_name, bucket_path):
         print("Deletion aborted.")
         return
 
+    def delete_secret(secret):
+        try:
+            entity.variables.delete(secret.key)
+            return True
+        except Exception as e:
+            print(f"Failed to delete secret {secret.key}: {e}")
+            return False
+
     secrets = get_secrets(entity)
-    for secret in secrets:
-        entity.variables.delete(secret.key)
-    print("All secrets deleted.")
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        results = list(executor.map(delete_secret, secrets))
+    if all(results):
+        print("All secrets deleted.")
+    else:
+        print(f"Deleted {sum(results)} of {len(results)} secrets.")
 
 
 def restore_secrets(entity, file_name, bucket_name, bucket_path):
@@ -134,7 +173,12 @@ def restore_secrets(entity, file_name, bucket_name, bucket_path):
         download_from_gcs(file_name, bucket_name, bucket_path)
         with open(file_name, "r") as f:
             secrets = json.load(f)
-        for secret in secrets:
+    except Exception as e:
+        print(f"Failed to restore secrets: {e}")
+        return
+
+    def restore_secret(secret):
+        try:
             entity.variables.create(
                 {
                     "key": secret["key"],
@@ -146,9 +190,17 @@ def restore_secrets(entity, file_name, bucket_name, bucket_path):
                     "description": secret["description"],
                 }
             )
+            return True
+        except Exception as e:
+            print(f"Failed to restore secret {secret.get('key')}: {e}")
+            return False
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        results = list(executor.map(restore_secret, secrets))
+    if all(results):
         print("Secrets restored successfully.")
-    except Exception as e:
-        print(f"Failed to restore secrets: {e}")
+    else:
+        print(f"Restored {sum(results)} of {len(results)} secrets.")
 
 
 def upload_to_gcs(file_name, bucket_name, bucket_path):
@@ -159,41 +211,57 @@ def upload_to_gcs(file_name, bucket_name, bucket_path):
     print(f"Backup file uploaded to gs://{bucket_name}/{bucket_path}/{file_name}")
 
 
-def get_doppler_project_secrets(doppler_token, project_name):
+def secret_fingerprint(secret_value):
+    """Short digest used as the reverse-index key so raw secret values aren't kept in memory."""
+    return hashlib.blake2b(secret_value.encode("utf-8"), digest_size=16).digest()
+
+@functools.lru_cache(maxsize=4)
+def get_doppler_project_secrets(doppler_token, project_name, session):
+    """
+    Build a reverse index of secret fingerprint -> Doppler reference for every config in the project.
+    Config secrets are fetched concurrently, and the result is memoized per process so
+    migrating several entities in one run doesn't refetch it. Callers must not mutate it.
+    """
     url = f"https://api.doppler.com/v3/configs?project={project_name}"
     headers = {"Authorization": f"Bearer {doppler_token}"}
-    response = requests.get(url, headers=headers)
+    response = session.get(url, headers=headers)
     response.raise_for_status()
     configs = response.json().get("configs", [])
-    all_secrets = {}
-    for config in configs:
-        config_name = config["name"]
+
+    def fetch_config_secrets(config_name):
         secrets_url = f"https://api.doppler.com/v3/configs/config/secrets?project={project_name}&config={config_name}"
-        response = requests.get(secrets_url, headers=headers)
+        response = session.get(secrets_url, headers=headers)
         response.raise_for_status()
-        secrets = response.json().get("secrets", {})
-        for key, secret_data in secrets.items():
-            if isinstance(secret_data, dict) and "raw" in secret_data:
-                secret_value = secret_data["raw"].strip()
-                all_secrets[secret_value] = f"${{{project_name}.{config_name}.{key}}}"
+        return config_name, response.json().get("secrets", {})
+
+    all_secrets = {}
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        # map preserves config order, so later configs win on duplicate values as before
+        for config_name, secrets in executor.map(fetch_config_secrets, [config["name"] for config in configs]):
+            for key, secret_data in secrets.items():
+                if isinstance(secret_data, dict) and "raw" in secret_data:
+                    secret_value = secret_data["raw"].strip()
+                    all_secrets[secret_fingerprint(secret_value)] = f"${{{project_name}.{config_name}.{key}}}"
     return all_secrets
 
-def upload_secrets_to_doppler(doppler_project, doppler_parent, entity, gitlab_token, doppler_token):
+def upload_secrets_to_doppler(doppler_project, doppler_parent, entity, gitlab_token, doppler_token, session, gitlab_secrets=None):
     print(f"Uploading secrets to Doppler... https://dashboard.doppler.com/workplace/428509ea97ee92f547c1/projects/{doppler_project}")
 
     case_alert_needed = False
     case_alert_variables = []
     
-    check_or_create_doppler_project(doppler_project, doppler_token)
+    check_or_create_doppler_project(doppler_project, doppler_token, session)
     
-    existing_secrets = get_doppler_project_secrets(doppler_token, "live_clusters")
+    existing_secrets = get_doppler_project_secrets(doppler_token, "live_clusters", session)
     
     url = "https://api.doppler.com/v3/configs/config/secrets"
     headers = {"Authorization": f"Bearer {doppler_token}", "Content-Type": "application/json"}
     
     secrets = {}
     change_requests = []
-    for var in entity.variables.list(get_all=True):
+    if gitlab_secrets is None:
+        gitlab_secrets = get_secrets(entity)
+    for var in gitlab_secrets:
         if not var.key.isupper():
             case_alert_needed = True
             case_alert_variables.append(var.key)
@@ -201,7 +269,7 @@ def upload_secrets_to_doppler(doppler_project, doppler_parent, entity, gitlab_to
         key = var.key.upper()
         value = var.value.strip()
         if value != "":  # Do not try to match empty variables to Cluster Secrets
-            value = existing_secrets.get(value, var.value)
+            value = existing_secrets.get(secret_fingerprint(value), var.value)
 
             secrets[key] = value
 
@@ -224,29 +292,33 @@ def upload_secrets_to_doppler(doppler_project, doppler_parent, entity, gitlab_to
         "visibility": "unmasked"
     })
     
-    for env in ["dev", "stg", "prd"]:
+    def upload_to_env(env):
         payload = {"project": doppler_project, "config": env, "secrets": secrets}
-        response = requests.post(url, json=payload, headers=headers)
+        response = session.post(url, json=payload, headers=headers)
         if response.status_code == 200:
             print(f"Successfully uploaded secrets to Doppler {env}")
         else:
             print(f"Failed to upload secrets to Doppler {env}: {response.text}")
-    
-    # Apply change requests to unmask secrets
-    if change_requests:
-        for env in ["dev", "stg", "prd"]:
+
+        # Apply change requests to unmask secrets
+        if change_requests:
             change_payload = {"project": doppler_project, "config": env, "change_requests": change_requests}
-            change_response = requests.post(url, json=change_payload, headers=headers)
+            change_response = session.post(url, json=change_payload, headers=headers)
             if change_response.status_code == 200:
                 print(f"Successfully updated visibility of referenced secrets in Doppler {env}")
             else:
                 print(f"Failed to update visibility of referenced secrets in Doppler {env}: {change_response.text}")
 
+    # Environments are independent, so upload to all of them concurrently
+    with ThreadPoolExecutor(max_workers=len(DOPPLER_ENVIRONMENTS)) as executor:
+        list(executor.map(upload_to_env, DOPPLER_ENVIRONMENTS))
+
     return case_alert_needed, case_alert_variables
 
 def main():
     args = parse_args()
-    entity = get_gitlab_entity(args.gitlab_url, args.gitlab_token, args.gitlab_id, args.gitlab_type)
+    session = create_http_session()
+    entity = get_gitlab_entity(args.gitlab_url, args.gitlab_token, args.gitlab_id, args.gitlab_type, session)
     
     # Generate Doppler project name
     doppler_project_name = generate_doppler_config_name(entity.full_path if hasattr(entity, 'full_path') else entity.path_with_namespace)
@@ -261,12 +333,12 @@ def main():
         restore_secrets(entity, file_name, args.bucket_name, args.bucket_path)
         return
     
-    file_name = backup_secrets(entity, args.gitlab_type)
+    file_name, gitlab_secrets = backup_secrets(entity, args.gitlab_type)
     # print(f"Backup file content:")
     # with open(file_name, "r") as f:
     #     print(f.read())
     upload_to_gcs(file_name, args.bucket_name, args.bucket_path)
-    case_alert_needed, case_alert_variables = upload_secrets_to_doppler(doppler_project_name, doppler_parent_name, entity, args.gitlab_token, args.doppler_token)
+    case_alert_needed, case_alert_variables = upload_secrets_to_doppler(doppler_project_name, doppler_parent_name, entity, args.gitlab_token, args.doppler_token, session, gitlab_secrets)
 
     if case_alert_needed:
         print()
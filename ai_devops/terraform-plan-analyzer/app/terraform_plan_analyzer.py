@@ -2,15 +2,25 @@
 
 import json
 import os
+import hashlib
 import sys
-import argparse
 import logging
 import re
+import string
 import glob
-from typing import Dict, List, Any, Set
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Dict, List, Any, Set, FrozenSet, Iterable, Iterator, Optional, Tuple
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
 import copy
 import gitlab
+import requests
+try:
+    import orjson # Faster parsing and writing of large plan.json files
+except ImportError:
+    orjson = None
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -51,6 +61,24 @@ SENSITIVE_FIELD_PATTERNS = [
     "signature"
 ]
 
+# Lowercased sensitive field names, matched as substrings of lowercased keys
+SENSITIVE_FIELDS = frozenset(pattern.lower() for pattern in SENSITIVE_FIELD_PATTERNS)
+
+# Separators between the components of a sensitive value path (e.g. "aws_instance.web.tags[0].name")
+PATH_SEPARATOR_RE = re.compile(r'[.\[]')
+
+# Matches `<sensitive>... = "value"` or `<sensitive>... = value` in Terraform code
+SENSITIVE_ASSIGNMENT_RE = re.compile(
+    r'((?:' + '|'.join(map(re.escape, SENSITIVE_FIELD_PATTERNS)) + r')\w*)\s*=\s*("[^"]*"|[^\s,"{}]+)',
+    re.IGNORECASE
+)
+
+def _redact_assignment(match: re.Match) -> str:
+    """Replace the value of a sensitive assignment, keeping quoted values quoted"""
+    if match.group(2).startswith('"'):
+        return f'{match.group(1)} = "[REDACTED]"'
+    return f'{match.group(1)} = [REDACTED]'
+
 # Maximum context window size (in tokens) for Gemini
 # These are conservative estimates - actual limits may vary by model
 GEMINI_CONTEXT_LIMITS = {
@@ -66,6 +94,85 @@ GEMINI_CONTEXT_LIMITS = {
 # Approximate tokens per character for estimation
 TOKENS_PER_CHAR = 0.25
 
+# Placeholders of the prompt template (prompt.txt)
+PROMPT_PLACEHOLDER_RE = re.compile(r'\{(terraform_context|changes_text)\}')
+
+# Code fence at the start or end of a Gemini response
+CODE_FENCE_RE = re.compile(r"\A```\n?|\n?```\Z")
+
+# Retries for failed Gemini calls, with exponential backoff starting at this delay (seconds)
+GEMINI_MAX_RETRIES = 3
+GEMINI_RETRY_BASE_DELAY = 2
+
+# Transient Gemini API errors worth retrying (rate limits, overload, timeouts); any other error
+# (invalid API key, unknown model, blocked response...) fails on the first attempt
+GEMINI_RETRYABLE_ERRORS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.InternalServerError,
+)
+
+# Message used when the plan contains no resource changes, and the separator between formatted changes
+NO_CHANGES_MESSAGE = "No changes detected in the Terraform plan."
+RESOURCE_CHANGE_SEPARATOR = "\n\n===\n\n"
+
+# When a prompt exceeds the context window, the Terraform files are first cut down to their
+# first and last lines, in increasingly tight (head, tail) steps, until the prompt uses at most
+# PRUNE_TARGET_RATIO of the window. The code is dropped if even the tightest step is too large.
+PRUNE_STEPS = [(80, 20), (40, 10), (15, 5)]
+PRUNE_TARGET_RATIO = 0.9
+
+# Start of each Terraform file in the code included in the prompt
+TERRAFORM_FILE_HEADER_RE = re.compile(r'^# File: ', re.MULTILINE)
+
+# Address of each resource change in a formatted chunk of the plan
+RESOURCE_ADDRESS_RE = re.compile(r'^Resource: (.+)$', re.MULTILINE)
+
+# When a prompt still exceeds the context window, the plan is analyzed in chunks using this
+# share of the window each, with up to GEMINI_CHUNK_WORKERS concurrent Gemini calls
+CHUNK_CONTEXT_RATIO = 0.8
+GEMINI_CHUNK_WORKERS = 4
+
+# Prompt merging the analyses of the chunks of a plan into one
+CHUNK_SYNTHESIS_PROMPT = """The following are analyses of consecutive parts of one Terraform plan. They were produced separately because the plan is too large to analyze in a single request.
+
+Merge them into a single analysis in the same Markdown format:
+- Keep every per-resource section, unchanged and in order.
+- Keep footnotes, renumbering them so they are unique across the merged analysis.
+- Replace the per-part overall recommendations with one overall recommendation for the whole plan.
+- Do not wrap the response in a code block.
+
+{partial_analyses}
+"""
+
+# On-disk cache of Gemini responses keyed by a hash of the model and prompt (empty GEMINI_CACHE_DIR disables it)
+GEMINI_CACHE_DIR = os.environ.get("GEMINI_CACHE_DIR", "/tmp/tf-analyzer-cache")
+GEMINI_CACHE_TTL_SECONDS = int(os.environ.get("GEMINI_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+GEMINI_CACHE_MAX_ENTRIES = int(os.environ.get("GEMINI_CACHE_MAX_ENTRIES", 256))
+
+# Directory where the ID of the analysis comment is remembered per project and merge request
+COMMENT_ID_CACHE_DIR = os.environ.get("COMMENT_ID_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "tf-plan-analyzer"))
+
+# Maximum number of threads used to read Terraform files
+MAX_READ_WORKERS = 32
+
+# GitLab API client shared by all calls in the process, created on first use
+GITLAB_URL = 'https://gitlab.com'
+_gitlab_client: Optional[gitlab.Gitlab] = None
+
+# Body of the merge request comment holding the analysis
+COMMENT_BODY_TEMPLATE = string.Template("""
+$identifier
+## $header
+
+**$commit_info**
+
+$response
+
+""")
+
+@lru_cache(maxsize=512)
 def get_resource_doc_url(provider_name: str, resource_type: str) -> str:
     """
     Construct the documentation URL for a given resource type and provider.
@@ -88,8 +195,9 @@ def get_resource_doc_url(provider_name: str, resource_type: str) -> str:
     
     return doc_url
 
-def format_value(value: Any) -> str:
-    """Format a value for display in Terraform-like output"""
+@lru_cache(maxsize=8192, typed=True)
+def _format_scalar(value: Any) -> str:
+    """Format a str, None, bool or number for display (cached, as the same values recur across resources)"""
     if isinstance(value, str):
         # Escape any quotation marks in the string
         escaped_value = value.replace('"', '\\"')
@@ -98,6 +206,13 @@ def format_value(value: Any) -> str:
         return "null"
     elif isinstance(value, bool):
         return str(value).lower()
+    else:
+        return str(value)
+
+def format_value(value: Any) -> str:
+    """Format a value for display in Terraform-like output"""
+    if value is None or isinstance(value, (str, bool, int, float)):
+        return _format_scalar(value)
     elif isinstance(value, list):
         # Format list contents
         if not value:
@@ -136,7 +251,7 @@ def format_value(value: Any) -> str:
     else:
         return str(value)
 
-def create_detailed_change_output(resource: Dict) -> str:
+def create_detailed_change_output(resource: Dict[str, Any]) -> str:
     """Create detailed textual representation of the changes for a resource"""
     # Get the necessary information
     address = resource.get('address', 'Unknown')
@@ -170,11 +285,12 @@ def create_detailed_change_output(resource: Dict) -> str:
         resource_display_name = address
     
     # Start building the output
-    output = f"# {address} {action_description}\n"
-    output += f"{symbol} resource \"{resource_display_type}\" \"{resource_display_name}\" {{\n"
+    parts: List[str] = [f"# {address} {action_description}\n"]
+    parts.append(f"{symbol} resource \"{resource_display_type}\" \"{resource_display_name}\" {{\n")
     
-    # For simple scalar attributes, add them directly to the output
-    all_keys = set(before.keys()) | set(after.keys())
+    # All attribute names, sorted once
+    all_keys = before.keys() | after.keys()
+    sorted_keys = sorted(all_keys)
     
     # Always include id and name if available
     for key in ['id', 'name']:
@@ -182,163 +298,151 @@ def create_detailed_change_output(resource: Dict) -> str:
             if key in after:
                 val = after[key]
                 formatted_val = format_value(val)
-                output += f" {key} = {formatted_val}\n"
+                parts.append(f" {key} = {formatted_val}\n")
     
-    # Process the rest of the attributes
-    processed_keys = set(['id', 'name'])  # Keep track of already processed keys
+    # Classify each attribute in a single pass: updates are written first (nested
+    # objects and changes), attributes only present for create/delete are appended after them
+    new_attribute_parts: List[str] = []
+    shown_count = 2  # id and name always count as shown
     
-    # Process nested objects and changes first
-    for key in sorted(all_keys):
-        if key in processed_keys:
+    for key in sorted_keys:
+        if key == 'id' or key == 'name':
             continue  # Skip already processed keys
-            
+        
         before_val = before.get(key)
         after_val = after.get(key)
         
-        # Skip if both values are None
+        # Skip (and hide) if both values are None
         if before_val is None and after_val is None:
             continue
+        shown_count += 1
+        
+        if key not in before:
+            if 'create' in actions:
+                # For create: show only new value
+                new_attribute_parts.append(f" + {key} = {format_value(after_val)}\n")
+            continue
+        
+        if key not in after:
+            if 'delete' in actions:
+                # For delete: show only old value
+                new_attribute_parts.append(f" - {key} = {format_value(before_val)}\n")
+            continue
+        
+        if before_val == after_val:
+            continue
+        
+        # For update: show both values
+        action_symbol = "~"
+        
+        # Handle different types of data structures
+        if isinstance(before_val, dict) and isinstance(after_val, dict):
+            # For nested dictionary objects
+            parts.append(f" {action_symbol} {key} {{\n")
             
-        # Process nested objects and changes
-        if key in before and key in after and before_val != after_val:
-            # For update: show both values
-            action_symbol = "~"
+            # Process nested attributes
+            nested_keys = set(before_val.keys()) | set(after_val.keys())
+            processed_nested_keys: List[str] = []
             
-            # Handle different types of data structures
-            if isinstance(before_val, dict) and isinstance(after_val, dict):
-                # For nested dictionary objects
-                output += f" {action_symbol} {key} {{\n"
+            for nested_key in sorted(nested_keys):
+                nested_before = before_val.get(nested_key)
+                nested_after = after_val.get(nested_key)
                 
-                # Process nested attributes
-                nested_keys = set(before_val.keys()) | set(after_val.keys())
-                processed_nested_keys = []
-                
-                for nested_key in sorted(nested_keys):
-                    nested_before = before_val.get(nested_key)
-                    nested_after = after_val.get(nested_key)
+                if nested_before != nested_after:
+                    processed_nested_keys.append(nested_key)
                     
-                    if nested_before != nested_after:
-                        processed_nested_keys.append(nested_key)
-                        
-                        # Format the values
-                        formatted_before = format_value(nested_before)
-                        formatted_after = format_value(nested_after)
-                        
-                        output += f"  {action_symbol} {nested_key} = {formatted_before} -> {formatted_after}\n"
-                
-                # Add comment about hidden attributes
-                hidden_count = len(nested_keys) - len(processed_nested_keys)
-                if hidden_count > 0:
-                    output += f"  # ({hidden_count} unchanged attributes hidden)\n"
-                
-                output += " }\n"
-                
-            elif isinstance(before_val, list) and isinstance(after_val, list):
-                # For list changes, we need to show the actual content differences
-                
-                # Enhanced list comparison to identify changes
-                if len(before_val) == len(after_val):
-                    # Check if the lists contain dictionaries
-                    if all(isinstance(x, dict) for x in before_val + after_val):
-                        # For lists of dictionaries (common in Terraform resources)
-                        
-                        # Try to identify the changed items by comparing the list entries
-                        changed_items = False
-                        
-                        # If lists of dicts, we need to identify the changes in detail
-                        output += f" {action_symbol} {key} = [\n"
+                    # Format the values
+                    formatted_before = format_value(nested_before)
+                    formatted_after = format_value(nested_after)
+                    
+                    parts.append(f"  {action_symbol} {nested_key} = {formatted_before} -> {formatted_after}\n")
+            
+            # Add comment about hidden attributes
+            hidden_count = len(nested_keys) - len(processed_nested_keys)
+            if hidden_count > 0:
+                parts.append(f"  # ({hidden_count} unchanged attributes hidden)\n")
+            
+            parts.append(" }\n")
+            
+        elif isinstance(before_val, list) and isinstance(after_val, list):
+            # For list changes, we need to show the actual content differences
+            
+            # Enhanced list comparison to identify changes
+            if len(before_val) == len(after_val):
+                # Check if the lists contain dictionaries
+                if all(isinstance(x, dict) for x in before_val + after_val):
+                    # For lists of dictionaries (common in Terraform resources)
+                    
+                    # Try to identify the changed items by comparing the list entries
+                    changed_items = False
+                    
+                    # If lists of dicts, we need to identify the changes in detail
+                    list_header_index = len(parts)
+                    parts.append(f" {action_symbol} {key} = [\n")
+                    
+                    # Try to match items by position or by common identifier fields
+                    for i in range(len(before_val)):
+                        before_item = before_val[i]
+                        after_item = after_val[i]
                         
-                        # Try to match items by position or by common identifier fields
-                        for i in range(len(before_val)):
-                            before_item = before_val[i]
-                            after_item = after_val[i]
+                        # Check if the items are different
+                        if before_item != after_item:
+                            changed_items = True
+                            parts.append(f"   {action_symbol} {{ # item {i}\n")
                             
-                            # Check if the items are different
-                            if before_item != after_item:
-                                changed_items = True
-                                output += f"   {action_symbol} {{ # item {i}\n"
-                                
-                                # Find the keys that differ
-                                all_item_keys = set(before_item.keys()) | set(after_item.keys())
-                                for item_key in sorted(all_item_keys):
-                                    before_field = before_item.get(item_key)
-                                    after_field = after_item.get(item_key)
-                                    
-                                    if before_field != after_field:
-                                        formatted_before = format_value(before_field)
-                                        formatted_after = format_value(after_field)
-                                        output += f"     {action_symbol} {item_key} = {formatted_before} -> {formatted_after}\n"
-                                    else:
-                                        # Show unchanged fields
-                                        formatted_val = format_value(before_field)
-                                        output += f"       {item_key} = {formatted_val}\n"
+                            # Find the keys that differ
+                            all_item_keys = set(before_item.keys()) | set(after_item.keys())
+                            for item_key in sorted(all_item_keys):
+                                before_field = before_item.get(item_key)
+                                after_field = after_item.get(item_key)
                                 
-                                output += "   },\n"
-                            else:
-                                # Item is unchanged, show it in abbreviated form
-                                first_field = next(iter(before_item.items()), ('unnamed', None))
-                                output += f"     {{ # unchanged item {i} ({first_field[0]} = {format_value(first_field[1])}) }},\n"
-                        
-                        output += " ]\n"
-                        
-                        if not changed_items:
-                            # If we couldn't identify specific changes, just show summary
-                            output = output.replace(f" {action_symbol} {key} = [\n", f" {action_symbol} {key} = {format_value(before_val)} -> {format_value(after_val)}\n")
-                    else:
-                        # For lists of simple values
-                        formatted_before = format_value(before_val)
-                        formatted_after = format_value(after_val)
-                        output += f" {action_symbol} {key} = {formatted_before} -> {formatted_after}\n"
+                                if before_field != after_field:
+                                    formatted_before = format_value(before_field)
+                                    formatted_after = format_value(after_field)
+                                    parts.append(f"     {action_symbol} {item_key} = {formatted_before} -> {formatted_after}\n")
+                                else:
+                                    # Show unchanged fields
+                                    formatted_val = format_value(before_field)
+                                    parts.append(f"       {item_key} = {formatted_val}\n")
+                            
+                            parts.append("   },\n")
+                        else:
+                            # Item is unchanged, show it in abbreviated form
+                            first_field = next(iter(before_item.items()), ('unnamed', None))
+                            parts.append(f"     {{ # unchanged item {i} ({first_field[0]} = {format_value(first_field[1])}) }},\n")
+                    
+                    parts.append(" ]\n")
+                    
+                    if not changed_items:
+                        # If we couldn't identify specific changes, just show summary
+                        parts[list_header_index] = f" {action_symbol} {key} = {format_value(before_val)} -> {format_value(after_val)}\n"
                 else:
-                    # Different length lists
+                    # For lists of simple values
                     formatted_before = format_value(before_val)
                     formatted_after = format_value(after_val)
-                    output += f" {action_symbol} {key} = {formatted_before} -> {formatted_after}\n"
+                    parts.append(f" {action_symbol} {key} = {formatted_before} -> {formatted_after}\n")
             else:
-                # For scalar values
+                # Different length lists
                 formatted_before = format_value(before_val)
                 formatted_after = format_value(after_val)
-                
-                output += f" {action_symbol} {key} = {formatted_before} -> {formatted_after}\n"
+                parts.append(f" {action_symbol} {key} = {formatted_before} -> {formatted_after}\n")
+        else:
+            # For scalar values
+            formatted_before = format_value(before_val)
+            formatted_after = format_value(after_val)
             
-            processed_keys.add(key)
+            parts.append(f" {action_symbol} {key} = {formatted_before} -> {formatted_after}\n")
     
-    # Add other attributes for create/delete actions
-    for key in sorted(all_keys):
-        if key in processed_keys:
-            continue  # Skip already processed keys
-            
-        before_val = before.get(key)
-        after_val = after.get(key)
-        
-        # Skip if both values are None
-        if before_val is None and after_val is None:
-            continue
-            
-        if key in after and key not in before and 'create' in actions:
-            # For create: show only new value
-            action_symbol = "+"
-            formatted_val = format_value(after_val)
-            output += f" {action_symbol} {key} = {formatted_val}\n"
-            
-        elif key in before and key not in after and 'delete' in actions:
-            # For delete: show only old value
-            action_symbol = "-"
-            formatted_val = format_value(before_val)
-            output += f" {action_symbol} {key} = {formatted_val}\n"
-            
-        processed_keys.add(key)
+    parts.extend(new_attribute_parts)
     
     # Add comment about hidden attributes for the resource
-    visible_attrs = len(processed_keys)
-    total_attrs = len(all_keys)
-    hidden_count = total_attrs - visible_attrs
+    hidden_count = len(all_keys) - shown_count
     if hidden_count > 0:
-        output += f" # ({hidden_count} unchanged attributes hidden)\n"
+        parts.append(f" # ({hidden_count} unchanged attributes hidden)\n")
     
-    output += "}"
+    parts.append("}")
     
-    return output
+    return "".join(parts)
 
 def setup_gemini_api():
     """Setup the Gemini API with credentials from environment variables"""
@@ -356,22 +460,56 @@ def setup_gemini_api():
 def parse_terraform_plan(plan_file: str) -> Dict:
     """Parse the Terraform plan.json file"""
     try:
-        with open(plan_file, 'r') as f:
-            plan_data = json.load(f)
-        return plan_data
+        # Read the raw bytes in one call and close the file before parsing
+        with open(plan_file, 'rb') as f:
+            plan_bytes = f.read()
+        if orjson is not None:
+            return orjson.loads(plan_bytes)
+        return json.loads(plan_bytes)
     except Exception as e:
         logger.error(f"Failed to parse Terraform plan file: {e}")
         sys.exit(1)
 
-def sanitize_sensitive_values(data: Any, sensitive_paths: Set[str] = None, current_path: str = "", sensitive_fields: Set[str] = None) -> Any:
+@lru_cache(maxsize=8)
+def compile_sensitive_key_re(sensitive_fields: FrozenSet[str]) -> re.Pattern:
+    """Compile a regex matching any of the sensitive field names as a substring"""
+    return re.compile('|'.join(map(re.escape, sorted(sensitive_fields))) or r'(?!)')
+
+def build_sensitive_path_prefixes(sensitive_paths: Set[str]) -> FrozenSet[str]:
+    """
+    Collect the prefixes of the sensitive paths that end at a '.' or '[' boundary.
+    
+    A container whose path is not in this set has no sensitive paths below it,
+    so the sanitizer can stop building and looking up paths for that subtree.
+    
+    Args:
+        sensitive_paths: Set of paths to sensitive values from the terraform plan
+        
+    Returns:
+        Frozen set of path prefixes
+    """
+    prefixes = set()
+    for path in sensitive_paths:
+        for match in PATH_SEPARATOR_RE.finditer(path):
+            prefixes.add(path[:match.start()])
+    return frozenset(prefixes)
+
+def sanitize_sensitive_values(data: Any, sensitive_paths: Optional[Set[str]] = None, current_path: str = "", sensitive_fields: Iterable[str] = SENSITIVE_FIELDS, sensitive_prefixes: Optional[FrozenSet[str]] = None) -> Any:
     """
-    Recursively sanitize sensitive values in the data.
+    Sanitize sensitive values in the data.
+    
+    The original data is never modified. It is walked iteratively without
+    copying, and only the containers leading to a redacted value are copied
+    (copy-on-write); unchanged subtrees are shared with the original data.
+    Subtrees without sensitive paths whose repr contains no sensitive field
+    name are skipped without being walked.
     
     Args:
         data: The data to sanitize
         sensitive_paths: Set of paths to sensitive values from the terraform plan
-        current_path: Current path in the data structure
+        current_path: Path of the data in the enclosing structure
         sensitive_fields: Set of field names that should be considered sensitive
+        sensitive_prefixes: Prefixes of sensitive_paths (see build_sensitive_path_prefixes)
         
     Returns:
         Sanitized data
@@ -379,48 +517,89 @@ def sanitize_sensitive_values(data: Any, sensitive_paths: Set[str] = None, curre
     if sensitive_paths is None:
         sensitive_paths = set()
     
-    if sensitive_fields is None:
-        sensitive_fields = set()
-        # Generate regex patterns for sensitive field names
-        for pattern in SENSITIVE_FIELD_PATTERNS:
-            sensitive_fields.add(pattern)
-    
-    # Make a deep copy to avoid modifying the original data
-    if isinstance(data, dict):
-        result = {}
-        for key, value in data.items():
-            # Build the current path for this key
-            new_path = f"{current_path}.{key}" if current_path else key
-            
-            # Check if this key is sensitive based on name patterns
-            key_is_sensitive = any(pattern in key.lower() for pattern in sensitive_fields)
-            
-            # Check if this path is marked as sensitive in the plan
-            path_is_sensitive = new_path in sensitive_paths
-            
-            if key_is_sensitive or path_is_sensitive:
-                if isinstance(value, (str, int, float, bool)) and value:
-                    # Redact sensitive scalar values
-                    result[key] = "[REDACTED]"
-                elif isinstance(value, (dict, list)) and value:
-                    # For complex types, indicate they were redacted but keep structure
-                    result[key] = "[REDACTED_COMPLEX_VALUE]"
+    if sensitive_prefixes is None:
+        sensitive_prefixes = build_sensitive_path_prefixes(sensitive_paths)
+    
+    # Match all sensitive field names in a single scan per key
+    sensitive_key_re = compile_sensitive_key_re(frozenset(sensitive_fields))
+    
+    if not isinstance(data, (dict, list)):
+        return data
+    
+    # Redactions are recorded as (link, key, replacement), where link is the
+    # (parent_link, key_or_index) chain leading from data to the container.
+    # A path of None marks a subtree without sensitive paths, where paths are no longer tracked
+    redactions: List[Tuple[Any, Any, str]] = []
+    stack: List[Tuple[Any, Optional[str], Any]] = [(data, current_path, None)]
+    while stack:
+        node, path, link = stack.pop()
+        
+        if isinstance(node, dict):
+            for key, value in node.items():
+                # Build the current path for this key
+                if path is None:
+                    new_path = None
                 else:
+                    new_path = f"{path}.{key}" if path else key
+                
+                # Check if this key is sensitive based on name patterns
+                key_is_sensitive = sensitive_key_re.search(key.lower()) is not None
+                
+                # Check if this path is marked as sensitive in the plan
+                path_is_sensitive = new_path in sensitive_paths
+                
+                if key_is_sensitive or path_is_sensitive:
+                    if isinstance(value, (str, int, float, bool)) and value:
+                        # Redact sensitive scalar values
+                        redactions.append((link, key, "[REDACTED]"))
+                    elif isinstance(value, (dict, list)) and value:
+                        # For complex types, indicate they were redacted but keep structure
+                        redactions.append((link, key, "[REDACTED_COMPLEX_VALUE]"))
                     # Null, empty dicts, empty lists - keep as is
-                    result[key] = value
-            else:
-                # Recursively sanitize non-sensitive fields
-                result[key] = sanitize_sensitive_values(
-                    value, sensitive_paths, new_path, sensitive_fields
-                )
-        return result
-    elif isinstance(data, list):
-        return [
-            sanitize_sensitive_values(item, sensitive_paths, f"{current_path}[{i}]", sensitive_fields)
-            for i, item in enumerate(data)
-        ]
-    else:
+                elif isinstance(value, (dict, list)):
+                    # Walk non-sensitive containers
+                    if new_path and new_path not in sensitive_prefixes:
+                        new_path = None
+                        # Skip the subtree if no key name in it can match (one C-level scan of its repr)
+                        if not sensitive_key_re.search(repr(value).lower()):
+                            continue
+                    stack.append((value, new_path, (link, key)))
+        else:
+            for i, item in enumerate(node):
+                if isinstance(item, (dict, list)):
+                    item_path = None
+                    if path is not None:
+                        item_path = f"{path}[{i}]"
+                        if item_path not in sensitive_prefixes:
+                            item_path = None
+                            # Skip the subtree if no key name in it can match (one C-level scan of its repr)
+                            if not sensitive_key_re.search(repr(item).lower()):
+                                continue
+                    stack.append((item, item_path, (link, i)))
+    
+    if not redactions:
         return data
+    
+    # Copy only the containers on the way to each redacted value, once each
+    result = copy.copy(data)
+    copies: Dict[int, Any] = {}
+    for link, key, replacement in redactions:
+        keys: List[Any] = []
+        while link is not None:
+            link, parent_key = link
+            keys.append(parent_key)
+        
+        source, target = data, result
+        for parent_key in reversed(keys):
+            source = source[parent_key]
+            source_copy = copies.get(id(source))
+            if source_copy is None:
+                source_copy = copies[id(source)] = copy.copy(source)
+            target[parent_key] = source_copy
+            target = source_copy
+        target[key] = replacement
+    
+    return result
 
 def extract_sensitive_paths(plan_data: Dict) -> Set[str]:
     """
@@ -432,7 +611,7 @@ def extract_sensitive_paths(plan_data: Dict) -> Set[str]:
     Returns:
         Set of paths to sensitive values
     """
-    sensitive_paths = set()
+    sensitive_paths: Set[str] = set()
     
     # Process resource changes
     if 'resource_changes' in plan_data:
@@ -453,7 +632,7 @@ def extract_sensitive_paths(plan_data: Dict) -> Set[str]:
 
 def extract_sensitive_keys(sensitive_data: Any, current_path: str, sensitive_paths: Set[str], is_sensitive: bool = False) -> None:
     """
-    Recursively extract sensitive keys from sensitive data structure.
+    Extract sensitive keys from sensitive data structure with an iterative walk.
     
     Args:
         sensitive_data: The sensitive data structure from the plan
@@ -461,28 +640,37 @@ def extract_sensitive_keys(sensitive_data: Any, current_path: str, sensitive_pat
         sensitive_paths: Set to store sensitive paths
         is_sensitive: Whether the parent was marked as sensitive
     """
-    if isinstance(sensitive_data, dict):
-        for key, value in sensitive_data.items():
-            new_path = f"{current_path}.{key}" if current_path else key
-            if value is True or is_sensitive:
-                sensitive_paths.add(new_path)
-            extract_sensitive_keys(value, new_path, sensitive_paths, value is True or is_sensitive)
-    elif isinstance(sensitive_data, list):
-        for i, item in enumerate(sensitive_data):
-            new_path = f"{current_path}[{i}]"
-            extract_sensitive_keys(item, new_path, sensitive_paths, is_sensitive)
+    stack: List[Tuple[Any, str, bool]] = [(sensitive_data, current_path, is_sensitive)]
+    while stack:
+        node, path, node_is_sensitive = stack.pop()
+        
+        if isinstance(node, dict):
+            for key, value in node.items():
+                value_is_sensitive = value is True or node_is_sensitive
+                is_container = isinstance(value, (dict, list))
+                # Only build the path when it is recorded or needed for children
+                if value_is_sensitive or is_container:
+                    new_path = f"{path}.{key}" if path else key
+                    if value_is_sensitive:
+                        sensitive_paths.add(new_path)
+                    if is_container:
+                        stack.append((value, new_path, value_is_sensitive))
+        elif isinstance(node, list):
+            for i, item in enumerate(node):
+                if isinstance(item, (dict, list)):
+                    stack.append((item, f"{path}[{i}]", node_is_sensitive))
 
-def extract_resource_changes(plan_data: Dict) -> List[Dict]:
-    """Extract resource changes from the plan data"""
-    resource_changes = []
-    
+def iter_resource_changes(plan_data: Dict, sensitive_paths: Optional[Set[str]] = None) -> Iterator[Dict]:
+    """Yield sanitized resource changes from the plan data, one resource at a time"""
     # Check if resource_changes exists in the plan
     if 'resource_changes' not in plan_data:
         logger.warning("No resource changes found in plan")
-        return resource_changes
+        return
     
-    # Extract sensitive paths from the plan
-    sensitive_paths = extract_sensitive_paths(plan_data)
+    # Extract sensitive paths from the plan (unless the caller already did)
+    if sensitive_paths is None:
+        sensitive_paths = extract_sensitive_paths(plan_data)
+    sensitive_prefixes = build_sensitive_path_prefixes(sensitive_paths)
     logger.info(f"Found {len(sensitive_paths)} sensitive paths in the plan")
     
     for resource in plan_data['resource_changes']:
@@ -508,8 +696,8 @@ def extract_resource_changes(plan_data: Dict) -> List[Dict]:
         after = resource.get('change', {}).get('after', {})
         
         # Sanitize sensitive values
-        sanitized_before = sanitize_sensitive_values(before, sensitive_paths)
-        sanitized_after = sanitize_sensitive_values(after, sensitive_paths)
+        sanitized_before = sanitize_sensitive_values(before, sensitive_paths, sensitive_prefixes=sensitive_prefixes)
+        sanitized_after = sanitize_sensitive_values(after, sensitive_paths, sensitive_prefixes=sensitive_prefixes)
         
         # Fix for the problem - check if after_sensitive is a dictionary before calling items()
         sensitive_fields = []
@@ -532,9 +720,11 @@ def extract_resource_changes(plan_data: Dict) -> List[Dict]:
             'sensitive_fields': sensitive_fields
         }
         
-        resource_changes.append(resource_info)
-    
-    return resource_changes
+        yield resource_info
+
+def extract_resource_changes(plan_data: Dict) -> List[Dict]:
+    """Extract resource changes from the plan data"""
+    return list(iter_resource_changes(plan_data))
 
 def analyze_resource_change(resource: Dict) -> Dict:
     """Analyze a single resource change and provide insights"""
@@ -557,21 +747,15 @@ def analyze_resource_change(resource: Dict) -> Dict:
     
     return analysis
 
-def format_resource_changes(resource_changes: List[Dict]) -> str:
-    """Format resource changes for Gemini API input"""
-    if not resource_changes:
-        return "No changes detected in the Terraform plan."
-
-    formatted_changes = []
+def format_resource_change(resource: Dict) -> str:
+    """Format a single resource change for Gemini API input"""
+    # Analyze the resource change
+    analysis = analyze_resource_change(resource)
 
-    for resource in resource_changes:
-        # Analyze the resource change
-        analysis = analyze_resource_change(resource)
+    # Create detailed change text
+    detailed_change = create_detailed_change_output(resource)
 
-        # Create detailed change text
-        detailed_change = create_detailed_change_output(resource)
-
-        change_description = f"""
+    return f"""
 Resource: {resource['address']}
 Type: {resource['type']}
 Documentation: {resource['doc_url']}
@@ -580,14 +764,34 @@ Change Summary:
 {analysis['change_summary']}
 {detailed_change}
 """
-        formatted_changes.append(change_description)
 
-    return "\n\n===\n\n".join(formatted_changes)
+def format_resource_changes(resource_changes: Iterable[Dict]) -> str:
+    """Format resource changes for Gemini API input"""
+    # Format each resource as it arrives, so a generator of changes is consumed in a single pass
+    formatted_changes = [format_resource_change(resource) for resource in resource_changes]
 
-def read_terraform_files(tf_directory: str, max_files: int = None) -> str:
-    """Read all Terraform files in the specified directory and subdirectories"""
-    terraform_code = []
+    if not formatted_changes:
+        return NO_CHANGES_MESSAGE
+
+    return RESOURCE_CHANGE_SEPARATOR.join(formatted_changes)
+
+def _read_terraform_file(file_path: str, tf_directory: str) -> Optional[str]:
+    """Read a single Terraform file and redact sensitive values, or return None on error"""
+    try:
+        with open(file_path, 'r') as f:
+            file_content = f.read()
+    except Exception as e:
+        logger.warning(f"Error reading Terraform file {file_path}: {e}")
+        return None
     
+    # Remove sensitive values from the code (key = "value" or key = value)
+    file_content = SENSITIVE_ASSIGNMENT_RE.sub(_redact_assignment, file_content)
+    
+    relative_path = os.path.relpath(file_path, tf_directory)
+    return f"# File: {relative_path}\n\n{file_content}"
+
+def read_terraform_files(tf_directory: str, max_files: Optional[int] = None) -> str:
+    """Read all Terraform files in the specified directory and subdirectories"""
     # Find all .tf files in the specified directory and subdirectories
     tf_files = glob.glob(f"{tf_directory}/**/*.tf", recursive=True)
     
@@ -609,47 +813,99 @@ def read_terraform_files(tf_directory: str, max_files: int = None) -> str:
     
     logger.info(f"Reading {len(tf_files)} Terraform files")
     
-    # Read each file
-    for file_path in tf_files:
-        try:
-            with open(file_path, 'r') as f:
-                relative_path = os.path.relpath(file_path, tf_directory)
-                file_content = f.read()
-                
-                # Remove sensitive values from the code
-                for pattern in SENSITIVE_FIELD_PATTERNS:
-                    # Find patterns like key = "value" or key = value
-                    file_content = re.sub(
-                        rf'({pattern}\w*)\s*=\s*"[^"]*"', 
-                        r'\1 = "[REDACTED]"', 
-                        file_content, 
-                        flags=re.IGNORECASE
-                    )
-                    file_content = re.sub(
-                        rf'({pattern}\w*)\s*=\s*[^\s,"{{}}]+', 
-                        r'\1 = [REDACTED]', 
-                        file_content, 
-                        flags=re.IGNORECASE
-                    )
-                
-                terraform_code.append(f"# File: {relative_path}\n\n{file_content}")
-        except Exception as e:
-            logger.warning(f"Error reading Terraform file {file_path}: {e}")
+    # Read the files in parallel, keeping the sorted order
+    with ThreadPoolExecutor(max_workers=min(MAX_READ_WORKERS, len(tf_files))) as executor:
+        contents = executor.map(lambda file_path: _read_terraform_file(file_path, tf_directory), tf_files)
+        terraform_code = [content for content in contents if content is not None]
     
     return "\n\n" + "\n\n".join(terraform_code)
 
+def count_terraform_files(tf_directory: str, cap: int = 10000) -> int:
+    """
+    Count the .tf files in a directory and its subdirectories.
+    
+    Uses os.scandir, whose entries carry the file type from the directory
+    listing, so no stat() is needed per file. Hidden entries are skipped like
+    glob does, and counting stops once cap files have been found.
+    """
+    count = 0
+    directories = [tf_directory]
+    while directories:
+        try:
+            with os.scandir(directories.pop()) as entries:
+                for entry in entries:
+                    if entry.name.startswith('.'):
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        directories.append(entry.path)
+                    elif entry.name.endswith('.tf') and entry.is_file():
+                        count += 1
+                        if count >= cap:
+                            return count
+        except OSError:
+            continue
+    return count
+
+def truncate_terraform_file(file_section: str, head: int, tail: int) -> str:
+    """Keep the first head and last tail lines of a Terraform file section, with a marker for the rest"""
+    # The first two lines are the "# File: <path>" header and the blank line after it
+    lines = file_section.split("\n")
+    body = lines[2:]
+    pruned_count = len(body) - head - tail
+    if pruned_count <= 1:
+        return file_section
+    
+    tail_lines = body[len(body) - tail:] if tail else []
+    return "\n".join(lines[:2] + body[:head] + [f"# [pruned — {pruned_count} lines]"] + tail_lines)
+
+def prune_terraform_code(changes_text: str, terraform_code: str, model_limit: int) -> str:
+    """
+    Shrink the Terraform code until the prompt fits in PRUNE_TARGET_RATIO of the context window.
+    
+    Each file is truncated to its first and last lines, tighter at every step of
+    PRUNE_STEPS, and the prompt is re-estimated after each step. Returns an
+    empty string if the prompt does not fit even with the tightest step.
+    """
+    budget = int(model_limit * PRUNE_TARGET_RATIO)
+    # Split before each "# File: " header, keeping the leading separator as the first part
+    starts = [match.start() for match in TERRAFORM_FILE_HEADER_RE.finditer(terraform_code)]
+    leading = terraform_code[:starts[0]] if starts else terraform_code
+    file_sections = [terraform_code[start:end] for start, end in zip(starts, starts[1:] + [len(terraform_code)])]
+    
+    for head, tail in PRUNE_STEPS:
+        pruned_code = leading + "".join(truncate_terraform_file(section, head, tail) for section in file_sections)
+        token_estimate = estimate_token_count(create_prompt(changes_text, pruned_code))
+        logger.info(f"Pruned Terraform files to their first {head} and last {tail} lines: {token_estimate} tokens")
+        if token_estimate <= budget:
+            return pruned_code
+    
+    logger.warning("Pruned Terraform code still exceeds the context window - leaving it out of the prompt")
+    return ""
+
 def estimate_token_count(text: str) -> int:
     """Estimate the number of tokens in a text string"""
-    # This is a simple estimation - actual token count may vary
+    # This is a simple estimation - actual token count may vary.
+    # len() is O(1) on str, so re-estimating a rebuilt prompt is free and needs no cache
+    # (hashing the prompt for a cache key would itself walk the whole string).
     return int(len(text) * TOKENS_PER_CHAR)
 
+@lru_cache(maxsize=1)
+def _load_prompt_template() -> str:
+    """Read the prompt template from the prompt.txt file (once per process)"""
+    with open("prompt.txt", "r") as f:
+        return f.read()
+
+@lru_cache(maxsize=1)
+def _load_prompt_parts() -> Tuple[str, ...]:
+    """Split the prompt template around its placeholders: text at even indices, placeholder names at odd ones"""
+    return tuple(PROMPT_PLACEHOLDER_RE.split(_load_prompt_template()))
+
 def create_prompt(changes_text: str, terraform_code: str = "") -> str:
     """Create the prompt for Gemini analysis"""
     
     # Read the prompt from the prompt.txt file
     try:
-        with open("prompt.txt", "r") as f:
-            prompt = f.read()
+        prompt_parts = _load_prompt_parts()
     except Exception as e:
         logger.error(f"Error reading prompt file: {e}")
         return ""
@@ -666,13 +922,81 @@ I've also included the Terraform code that defines these resources. Use this to
 
 """
     
-    # Replace placeholders in the prompt
-    prompt = prompt.replace("{terraform_context}", terraform_context)
-    prompt = prompt.replace("{changes_text}", changes_text)
+    # Fill in the placeholders and build the prompt with a single join
+    values = {"terraform_context": terraform_context, "changes_text": changes_text}
+    return "".join(values[part] if index % 2 else part for index, part in enumerate(prompt_parts))
+
+def get_gemini_cache_path(model: Any, prompt: str) -> Optional[str]:
+    """Return the cache file path for a model and prompt, or None if caching is disabled"""
+    if not GEMINI_CACHE_DIR:
+        return None
+    hasher = hashlib.blake2b(digest_size=16)
+    hasher.update(getattr(model, "model_name", "").encode("utf-8"))
+    hasher.update(b"\0")
+    hasher.update(prompt.encode("utf-8"))
+    return os.path.join(GEMINI_CACHE_DIR, f"{hasher.hexdigest()}.md")
+
+def read_gemini_cache(cache_path: Optional[str]) -> Optional[str]:
+    """Return a cached Gemini response that has not expired, or None"""
+    if not cache_path:
+        return None
+    try:
+        # The modification time is when the response was written: the TTL counts from it
+        written_at = os.stat(cache_path).st_mtime
+        if time.time() - written_at > GEMINI_CACHE_TTL_SECONDS:
+            return None
+        with open(cache_path, "r") as f:
+            response = f.read()
+        # Mark the entry as recently used for eviction in its access time, keeping its write time
+        os.utime(cache_path, (time.time(), written_at))
+        return response
+    except OSError:
+        return None
+
+def write_gemini_cache(cache_path: Optional[str], response: str) -> None:
+    """Store a Gemini response and evict the least recently used entries beyond the limit"""
+    if not cache_path:
+        return
+    try:
+        os.makedirs(GEMINI_CACHE_DIR, exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(response)
+        os.replace(tmp_path, cache_path)
+        
+        entries = glob.glob(os.path.join(GEMINI_CACHE_DIR, "*.md"))
+        if len(entries) > GEMINI_CACHE_MAX_ENTRIES:
+            entries.sort(key=os.path.getatime)
+            for entry in entries[:len(entries) - GEMINI_CACHE_MAX_ENTRIES]:
+                os.remove(entry)
+    except OSError as e:
+        logger.warning(f"Could not write Gemini response cache: {e}")
+
+def generate_gemini_analysis(model: Any, prompt: str) -> str:
+    """Send a prompt to Gemini (or reuse a cached response), raising the last error if every attempt fails"""
+    # Identical prompts (e.g. pipeline reruns) reuse the previous response
+    cache_path = get_gemini_cache_path(model, prompt)
+    cached_response = read_gemini_cache(cache_path)
+    if cached_response is not None:
+        logger.info(f"Using cached Gemini response from {cache_path}")
+        return cached_response
     
-    return prompt
+    for attempt in range(GEMINI_MAX_RETRIES + 1):
+        try:
+            response = model.generate_content(prompt)
+            # Remove ``` from the beginning and end of the response
+            response_text = CODE_FENCE_RE.sub("", response.text.replace('+!+!+!+!+!+!', "").strip())
+            write_gemini_cache(cache_path, response_text)
+            return response_text
 
-def analyze_with_gemini(model, prompt: str, dry_run: bool = False) -> str:
+        except GEMINI_RETRYABLE_ERRORS as e:
+            if attempt == GEMINI_MAX_RETRIES:
+                raise
+            delay = GEMINI_RETRY_BASE_DELAY * (2 ** attempt)
+            logger.warning(f"Error calling Gemini API (attempt {attempt + 1}/{GEMINI_MAX_RETRIES + 1}): {e} - retrying in {delay}s")
+            time.sleep(delay)
+
+def analyze_with_gemini(model: Any, prompt: str, dry_run: bool = False) -> str:
     """Use Gemini API to analyze the changes with context from Terraform code"""
     
     if dry_run:
@@ -680,19 +1004,142 @@ def analyze_with_gemini(model, prompt: str, dry_run: bool = False) -> str:
         return "DRY RUN MODE - Analysis not performed. Enable with --send-to-gemini flag."
     
     try:
-        response = model.generate_content(prompt)
-        response = response.text.replace('+!+!+!+!+!+!', "")
-        response = response.strip()
-        # Remove ``` from the beginning and end of the response
-        response = re.sub(r"^```\n?", "", response)
-        response = re.sub(r"\n?```$", "", response)
-
-        return response
-
+        return generate_gemini_analysis(model, prompt)
     except Exception as e:
         logger.error(f"Error calling Gemini API: {e}")
         return f"Error analyzing plan: {str(e)}"
 
+def _comment_id_cache_path(project_id: str, mr_iid: str) -> str:
+    """Return the file that remembers the analysis comment ID for a merge request"""
+    return os.path.join(COMMENT_ID_CACHE_DIR, f"{project_id}-{mr_iid}.json")
+
+def read_cached_comment_id(project_id: str, mr_iid: str) -> Optional[int]:
+    """Return the remembered analysis comment ID for a merge request, or None"""
+    if not COMMENT_ID_CACHE_DIR:
+        return None
+    try:
+        with open(_comment_id_cache_path(project_id, mr_iid), "r") as f:
+            return int(json.load(f)["note_id"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+def write_cached_comment_id(project_id: str, mr_iid: str, note_id: int) -> None:
+    """Remember the analysis comment ID so later runs can fetch it directly"""
+    if not COMMENT_ID_CACHE_DIR:
+        return
+    try:
+        os.makedirs(COMMENT_ID_CACHE_DIR, exist_ok=True)
+        with open(_comment_id_cache_path(project_id, mr_iid), "w") as f:
+            json.dump({"note_id": note_id}, f)
+    except OSError as e:
+        logger.warning(f"Could not remember comment ID: {e}")
+
+def split_changes_into_chunks(change_texts: List[str], max_tokens: int) -> List[str]:
+    """
+    Group consecutive formatted resource changes into chunks of at most max_tokens.
+    
+    The plan lists resources sorted by address, so consecutive grouping keeps
+    resources of the same module together. A single resource larger than
+    max_tokens gets a chunk of its own.
+    """
+    chunks: List[str] = []
+    current: List[str] = []
+    current_tokens = 0
+    separator_tokens = estimate_token_count(RESOURCE_CHANGE_SEPARATOR)
+    
+    for text in change_texts:
+        text_tokens = estimate_token_count(text) + separator_tokens
+        if current and current_tokens + text_tokens > max_tokens:
+            chunks.append(RESOURCE_CHANGE_SEPARATOR.join(current))
+            current = []
+            current_tokens = 0
+        current.append(text)
+        current_tokens += text_tokens
+    
+    if current:
+        chunks.append(RESOURCE_CHANGE_SEPARATOR.join(current))
+    return chunks
+
+def analyze_with_gemini_chunked(model: Any, change_texts: List[str], model_limit: int) -> str:
+    """
+    Analyze a plan that does not fit the context window with a map-reduce over chunks.
+    
+    Each chunk of resource changes is analyzed with the regular prompt (map),
+    then the partial analyses are merged by a final synthesis call (reduce).
+    """
+    # Leave room in each chunk for the fixed instructions of the prompt
+    prompt_overhead = estimate_token_count(create_prompt(""))
+    chunk_budget = max(1, int(model_limit * CHUNK_CONTEXT_RATIO) - prompt_overhead)
+    chunks = split_changes_into_chunks(change_texts, chunk_budget)
+    logger.info(f"Analyzing {len(change_texts)} resource changes in {len(chunks)} chunks")
+    
+    # Gemini calls are I/O-bound, so the chunks are analyzed in parallel threads
+    with ThreadPoolExecutor(max_workers=min(GEMINI_CHUNK_WORKERS, len(chunks))) as executor:
+        futures = [executor.submit(generate_gemini_analysis, model, create_prompt(chunk)) for chunk in chunks]
+    
+    # Failed chunks are left out of the synthesis (which would merge their error messages as if they
+    # were analyses) and listed at the end instead, so their resources are not silently missing
+    partial_analyses = []
+    failed_chunks = []
+    for index, (chunk, future) in enumerate(zip(chunks, futures), 1):
+        try:
+            partial_analyses.append(future.result())
+        except Exception as e:
+            logger.error(f"Error analyzing chunk {index}/{len(chunks)}: {e}")
+            failed_chunks.append((chunk, e))
+    
+    if not partial_analyses:
+        return f"Error analyzing plan: {str(failed_chunks[0][1])}"
+    
+    if len(partial_analyses) == 1:
+        analysis = partial_analyses[0]
+    else:
+        combined_analyses = "\n\n---\n\n".join(partial_analyses)
+        synthesis_prompt = CHUNK_SYNTHESIS_PROMPT.replace("{partial_analyses}", combined_analyses)
+        if estimate_token_count(synthesis_prompt) > model_limit:
+            logger.warning("Partial analyses are too large to merge - writing them one after another")
+            analysis = combined_analyses
+        else:
+            try:
+                analysis = generate_gemini_analysis(model, synthesis_prompt)
+            except Exception as e:
+                logger.warning(f"Error merging the partial analyses ({e}) - writing them one after another")
+                analysis = combined_analyses
+    
+    if failed_chunks:
+        analysis += format_failed_chunks(failed_chunks, len(chunks))
+    return analysis
+
+def format_failed_chunks(failed_chunks: List[Tuple[str, Exception]], chunk_count: int) -> str:
+    """List the resource changes of the chunks that could not be analyzed, as a warning appended to the analysis"""
+    lines = [
+        "",
+        "",
+        ">>> [!warning] Incomplete analysis",
+        f"{len(failed_chunks)} of {chunk_count} parts of the plan could not be analyzed, so these resource changes are not covered above:",
+    ]
+    for chunk, error in failed_chunks:
+        lines.extend(f"- `{address}` ({error})" for address in RESOURCE_ADDRESS_RE.findall(chunk))
+    lines.append(">>>")
+    return "\n".join(lines)
+
+def get_gitlab_client(gitlab_token: str) -> gitlab.Gitlab:
+    """
+    Return the process-wide GitLab client, creating it on first use.
+    
+    The client keeps a single HTTP session with a connection pool, so the
+    requests made for the merge request comment reuse the same TLS connection.
+    Rate limits and server errors are retried by python-gitlab itself.
+    """
+    global _gitlab_client
+    if _gitlab_client is None:
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=8)
+        session.mount('https://', adapter)
+        _gitlab_client = gitlab.Gitlab(GITLAB_URL, private_token=gitlab_token, per_page=100,
+                                       session=session, retry_transient_errors=True)
+    return _gitlab_client
+
 def send_gemini_response_to_gitlab(response_text: str):
     """Send the Gemini response to a comment in the GitLab Merge Request"""
     import gitlab
@@ -731,61 +1178,97 @@ def send_gemini_response_to_gitlab(response_text: str):
 
     try:
         # Connect to the GitLab API
-        gl = gitlab.Gitlab('https://gitlab.com', private_token=gitlab_token)
+        gl = get_gitlab_client(gitlab_token)
 
-        # Get the project
-        project = gl.projects.get(project_id)
+        # Get the project and Merge Request lazily (no API requests, only their IDs are needed)
+        project = gl.projects.get(project_id, lazy=True)
+        mr = project.mergerequests.get(mr_iid, lazy=True)
 
-        # Get the Merge Request
-        mr = project.mergerequests.get(mr_iid)
-
-        # Search for existing comments from this script
-        comments = mr.notes.list(all=True)  # Get all comments
         existing_comment = None
         
-        logger.info(f"Searching for existing comment among {len(comments)} comments...")
+        # Fetch the comment remembered by a previous run directly (one request)
+        cached_comment_id = read_cached_comment_id(project_id, mr_iid)
+        if cached_comment_id is not None:
+            try:
+                comment = mr.notes.get(cached_comment_id)
+                if comment_identifier in comment.body:
+                    existing_comment = comment
+                    logger.info(f"Found existing comment from cached ID: {comment.id}")
+            except gitlab.exceptions.GitlabGetError as e:
+                logger.info(f"Cached comment {cached_comment_id} not found ({e}), searching comments")
         
-        # First try to find by our hidden identifier (most reliable)
-        for comment in comments:
-            if comment_identifier in comment.body:
-                existing_comment = comment
-                logger.info(f"Found existing comment with identifier: {comment.id}")
-                break
-                
-        # If not found, try to find by the standard header (for backward compatibility)
         if not existing_comment:
-            for comment in comments:
-                if comment.body.strip().startswith(comment_header):
+            # Search for existing comments from this script, newest first, fetching pages only until a match.
+            # GitLab does not support keyset pagination for notes, so pages are fetched by offset; since the
+            # analysis comment is usually among the newest notes, the scan rarely goes past the first page.
+            header_comment = None
+            
+            logger.info("Searching for existing comment...")
+            
+            for comment in mr.notes.list(iterator=True, per_page=100, sort='desc', order_by='created_at'):
+                body = comment.body
+                
+                # First try to find by our hidden identifier (most reliable)
+                if comment_identifier in body:
                     existing_comment = comment
-                    logger.info(f"Found existing comment by header: {comment.id}")
+                    logger.info(f"Found existing comment with identifier: {comment.id}")
                     break
+                
+                # Remember the first comment with the standard header (for backward compatibility);
+                # other notes are not kept, so only the current page stays in memory
+                if header_comment is None and body.lstrip().startswith(comment_header):
+                    header_comment = comment
+                    
+            # If not found, fall back to the comment found by the standard header
+            if not existing_comment and header_comment is not None:
+                existing_comment = header_comment
+                logger.info(f"Found existing comment by header: {existing_comment.id}")
 
         # Prepare the comment body with our identifier and commit information
         commit_info = f"Analysis for commit: [{commit_short_id}]({commit_url}) ({commit_ref})"
         
-        comment_body = f"""
-{comment_identifier}
-## {comment_header}
-
-**{commit_info}**
-
-{response_text}
-
-"""
+        comment_body = COMMENT_BODY_TEMPLATE.substitute(identifier=comment_identifier, header=comment_header,
+                                                        commit_info=commit_info, response=response_text)
 
         # Create or update the comment
         if existing_comment:
             existing_comment.body = comment_body
             existing_comment.save()
+            write_cached_comment_id(project_id, mr_iid, existing_comment.id)
             logger.info(f"Updated existing comment (ID: {existing_comment.id}) in Merge Request !{mr_iid}")
         else:
             new_comment = mr.notes.create({'body': comment_body})
+            write_cached_comment_id(project_id, mr_iid, new_comment.id)
             logger.info(f"Created new comment (ID: {new_comment.id}) in Merge Request !{mr_iid}")
             
     except Exception as e:
         logger.error(f"Error while interacting with GitLab API: {e}")
 
+def write_bytes_file(path: str, data: bytes) -> None:
+    """
+    Write bytes to a file with unbuffered os.write calls.
+    
+    The data is handed to the kernel straight from its buffer, without the
+    copy into io.BufferedWriter. mmap is not used: it would need the file to
+    be resized first, and fails to map empty files.
+    """
+    view = memoryview(data)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        # os.write may write fewer bytes than requested, so write until everything is out
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
+def write_output_file(path: str, text: str) -> None:
+    """Write text to a file as UTF-8 bytes"""
+    write_bytes_file(path, text.encode('utf-8'))
+
 def main():
+    # argparse is only needed when run as a script, so it is not imported with the module
+    import argparse
+    
     parser = argparse.ArgumentParser(description='Analyze Terraform plan using Gemini API')
     parser.add_argument('--plan', required=True, help='Path to the Terraform plan.json file')
     parser.add_argument('--output', default='terraform_analysis.md', help='Output file for the analysis')
@@ -802,31 +1285,40 @@ def main():
     # Parse the Terraform plan
     plan_data = parse_terraform_plan(args.plan)
     
-    # Extract resource changes
-    resource_changes = extract_resource_changes(plan_data)
+    # Unless the whole plan is saved, only the resource changes are needed: release the other
+    # sections (prior_state, configuration, planned_values...) which make up most of a large plan
+    if not args.save_sanitized:
+        plan_data = {key: plan_data[key] for key in ('resource_changes',) if key in plan_data}
+    
+    # Extract the sensitive paths once, for both the resource changes and the sanitized plan
+    sensitive_paths = extract_sensitive_paths(plan_data)
+    
+    # Extract, sanitize and format the resource changes in a single pass over the plan
+    change_texts = [format_resource_change(resource) for resource in iter_resource_changes(plan_data, sensitive_paths)]
     
     # Optionally save the sanitized plan
     if args.save_sanitized:
-        # Create a sanitized copy of the plan
-        sensitive_paths = extract_sensitive_paths(plan_data)
-        sanitized_plan = sanitize_sensitive_values(copy.deepcopy(plan_data), sensitive_paths)
+        # Create a sanitized copy of the plan (copy-on-write, plan_data itself is not modified)
+        sanitized_plan = sanitize_sensitive_values(plan_data, sensitive_paths)
         
-        with open(args.save_sanitized, 'w') as f:
-            json.dump(sanitized_plan, f, indent=2)
+        if orjson is not None:
+            # Serialize to bytes in one call and write them at once
+            write_bytes_file(args.save_sanitized, orjson.dumps(sanitized_plan, option=orjson.OPT_INDENT_2))
+        else:
+            with open(args.save_sanitized, 'w') as f:
+                json.dump(sanitized_plan, f, indent=2)
         logger.info(f"Sanitized plan saved to {args.save_sanitized}")
     
-    terraform_code = ""
-    if not args.skip_code:
-        # Read and sanitize Terraform files
-        terraform_code = read_terraform_files(args.tf_dir, args.max_files)
-    
-    if not resource_changes:
-        analysis = "No changes detected in the Terraform plan."
+    if not change_texts:
+        analysis = NO_CHANGES_MESSAGE
     else:
-        # Format changes for Gemini
-        formatted_changes = format_resource_changes(resource_changes)
+        terraform_code = ""
+        if not args.skip_code:
+            # Read and sanitize Terraform files (only needed when there are changes to analyze)
+            terraform_code = read_terraform_files(args.tf_dir, args.max_files)
         
         # Create the prompt
+        formatted_changes = RESOURCE_CHANGE_SEPARATOR.join(change_texts)
         prompt = create_prompt(formatted_changes, terraform_code)
         
         # Check if the prompt is likely to exceed model's context window
@@ -836,6 +1328,14 @@ def main():
         
         logger.info(f"Estimated prompt size: {token_estimate} tokens (model limit: {model_limit})")
         
+        if token_estimate > model_limit and terraform_code:
+            # Prune the Terraform code before considering anything more expensive
+            logger.warning(f"Prompt likely exceeds model context window ({token_estimate} > {model_limit}) - pruning Terraform code")
+            terraform_code = prune_terraform_code(formatted_changes, terraform_code, model_limit)
+            prompt = create_prompt(formatted_changes, terraform_code)
+            token_estimate = estimate_token_count(prompt)
+            logger.info(f"Estimated prompt size after pruning: {token_estimate} tokens (model limit: {model_limit})")
+        
         if token_estimate > model_limit:
             logger.warning(f"Prompt likely exceeds model context window ({token_estimate} > {model_limit})")
             
@@ -843,8 +1343,7 @@ def main():
             if terraform_code and not args.skip_code:
                 # Try with just half the code files
                 if args.max_files is None:
-                    tf_files = glob.glob(f"{args.tf_dir}/**/*.tf", recursive=True)
-                    suggested_max = max(1, len(tf_files) // 2)
+                    suggested_max = max(1, count_terraform_files(args.tf_dir) // 2)
                     logger.warning(f"Try using --max-files={suggested_max} to reduce context size")
             
             # Other suggestions
@@ -854,13 +1353,12 @@ def main():
             logger.warning("3. Split your Terraform plan into smaller chunks")
             
             if not args.send_to_gemini:
-                logger.error("Aborting due to context size - use --send-to-gemini to override")
+                logger.error("Aborting due to context size - use --send-to-gemini to analyze the plan in chunks")
                 sys.exit(1)
         
         # Save the prompt if requested
         if args.save_prompt:
-            with open(args.save_prompt, 'w') as f:
-                f.write(prompt)
+            write_output_file(args.save_prompt, prompt)
             logger.info(f"Prompt saved to {args.save_prompt}")
         
         # Initialize the Gemini model if we're going to use it
@@ -868,16 +1366,18 @@ def main():
         if args.send_to_gemini:
             model = setup_gemini_api()
         
-        # Analyze with Gemini (or dry run)
-        analysis = analyze_with_gemini(model, prompt, not args.send_to_gemini)
+        # Analyze with Gemini (or dry run), in chunks if the prompt does not fit the context window
+        if args.send_to_gemini and token_estimate > model_limit:
+            analysis = analyze_with_gemini_chunked(model, change_texts, model_limit)
+        else:
+            analysis = analyze_with_gemini(model, prompt, not args.send_to_gemini)
 
         # Send the analysis to GitLab if requested
         if args.gitlab_comment:
             send_gemini_response_to_gitlab(analysis)
 
     # Write the analysis to a file
-    with open(args.output, 'w') as f:
-        f.write(analysis)
+    write_output_file(args.output, analysis)
 
     logger.info(f"Analysis written to {args.output}")
 
@@ -1,14 +1,22 @@
 import requests
 import logging
+import json
+import math
 import re
 import sys
 import os
-import shutil
 import zipfile
 import time
+import threading
+from dataclasses import dataclass, field
+from typing import Optional
 from datetime import datetime, timedelta
 from collections import defaultdict
 from concurrent.futures import ThreadPoolExecutor, as_completed
+try:
+    import orjson  # Faster parsing of the API responses
+except ImportError:
+    orjson = None
 
 # GitLab project details
 GITLAB_URL = "https://gitlab.com"
@@ -25,33 +33,91 @@ MAX_WORKERS = 8  # Optimal concurrency for GitLab.com rate limits
 RETRY_ATTEMPTS = 3  # Number of retries for failed requests
 RETRY_BACKOFF = 2  # Exponential backoff multiplier
 
-# Headers for the API requests
-headers = {
-    "Private-Token": ACCESS_TOKEN
-}
+# Shared HTTP session: reuses keep-alive connections to GitLab instead of a new TCP+TLS handshake per request
+# Pool sized so every worker thread keeps its own connection (retries are handled by make_api_request_with_retry)
+session = requests.Session()
+session.headers.update({"Private-Token": ACCESS_TOKEN})
+session.mount("https://", requests.adapters.HTTPAdapter(pool_connections=MAX_WORKERS, pool_maxsize=MAX_WORKERS * 2, max_retries=0))
 
-# Rate limit tracking
-rate_limit_remaining = None
-rate_limit_reset = None
+# At most MAX_WORKERS requests are in flight, whether sent by pipeline workers or page workers
+request_slots = threading.BoundedSemaphore(MAX_WORKERS)
+
+# Threads fetching the pages after the first of a pipeline's jobs (separate from the pipeline
+# workers, which wait on these pages and would otherwise deadlock a shared pool)
+page_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+
+# On-disk cache of job listings for pipelines in a terminal state, whose jobs no longer change
+# Set GITLAB_JOBS_CACHE_DIR to an empty string to disable
+JOBS_CACHE_DIR = os.environ.get("GITLAB_JOBS_CACHE_DIR", ".gitlab_jobs_cache")
+TERMINAL_PIPELINE_STATUSES = {"success", "failed", "canceled", "skipped"}
+
+# Pipelines in these states never ran their jobs, so their jobs are not fetched
+NOT_RUN_PIPELINE_STATUSES = {"skipped", "created"}
+
+# The project-wide jobs listing is paged sequentially and also returns the jobs of cached pipelines,
+# so it is only used when it saves at least this many requests over fetching the jobs of each pipeline
+BULK_JOBS_MIN_SAVED_REQUESTS = 20
+
+# Jobs per pipeline assumed when estimating the size of the jobs listing before any pipeline's jobs are cached
+DEFAULT_JOBS_PER_PIPELINE = 30
+
+# Flags combining the statuses of a job's attempts (any other status counts as OTHER_STATUS_FLAG)
+SUCCESS_FLAG = 1
+FAILED_FLAG = 2
+OTHER_STATUS_FLAG = 4
+STATUS_FLAGS = {"success": SUCCESS_FLAG, "failed": FAILED_FLAG}
+
+# Next page URL in a Link header, e.g. <https://gitlab.com/api/v4/...&page=2>; rel="next"
+NEXT_LINK_RE = re.compile(r'<([^>]+)>;\s*rel="next"')
+
+# Proactive throttling: when fewer than RATE_LIMIT_THROTTLE_THRESHOLD requests remain, new requests
+# wait (on RateLimitState.ok) until the rate limit window resets instead of running into 429s
+RATE_LIMIT_THROTTLE_THRESHOLD = MAX_WORKERS * 2
 
 # Calculate date range (default 30 days)
 DAYS_AGO = 30  # From April 1, 2025 to present (253 Days as of 12/10/25)
 days_ago = datetime.now() - timedelta(days=DAYS_AGO)
 days_ago_iso = days_ago.isoformat()
 
-# Global variables for output
-project_name = ""
-sanitized_project_name = ""
-output_filename = ""
-log_filename = ""
+@dataclass
+class RateLimitState:
+    """
+    Rate limit tracking from the API response headers.
+    GitLab counts requests per token, so it is shared by all projects analyzed with ACCESS_TOKEN.
+    """
+    remaining: Optional[int] = None
+    reset: Optional[int] = None
+    ok: threading.Event = field(default_factory=threading.Event)  # Cleared while requests are paused
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def __post_init__(self):
+        self.ok.set()
 
-def setup_logging():
+@dataclass
+class ProjectContext:
     """
-    Configure logging to output to both console and file
+    State of the analysis of one project, passed to the functions fetching and analyzing its data.
     """
-    global log_filename
-    log_filename = f"{sanitized_project_name}_flakiness_analysis_log.txt"
+    project_id: str
+    rate_limit: RateLimitState
+    project_name: str = ""
+
+    @property
+    def sanitized_project_name(self):
+        return sanitize_filename(self.project_name)
 
+    @property
+    def output_filename(self):
+        return f"{self.sanitized_project_name}_flakiness_analysis_results.txt"
+
+    @property
+    def log_filename(self):
+        return f"{self.sanitized_project_name}_flakiness_analysis_log.txt"
+
+def setup_logging(ctx):
+    """
+    Configure logging to output to both console and file
+    """
     # Clear previous handlers to avoid duplicates
     if logging.root.handlers:
         for handler in logging.root.handlers[:]:
@@ -61,26 +127,21 @@ def setup_logging():
         level=logging.INFO,
         format='%(asctime)s - %(levelname)s - %(message)s',
         handlers=[
-            logging.FileHandler(log_filename, mode='w'),  # Log to file
+            logging.FileHandler(ctx.log_filename, mode='w'),  # Log to file
             logging.StreamHandler()  # Log to console
         ]
     )
 
-def fetch_project_name(project_id):
+def fetch_project_name(ctx):
     """
     Fetch the project name using the GitLab API.
     """
-    global project_name, sanitized_project_name, output_filename
-
-    url = f"{GITLAB_URL}/api/v4/projects/{project_id}"
-    response = requests.get(url, headers=headers)
+    url = f"{GITLAB_URL}/api/v4/projects/{ctx.project_id}"
+    response = session.get(url)
+    update_rate_limit_info(ctx, response)  # Prime the throttle before the concurrent requests start
     response.raise_for_status()
-    project_data = response.json()
-    project_name = project_data['name']
-    sanitized_project_name = sanitize_filename(project_name)
-    output_filename = f"{sanitized_project_name}_flakiness_analysis_results.txt"
-
-    return project_name
+    project_data = parse_json_response(response)
+    return project_data['name']
 
 def sanitize_filename(name):
     """
@@ -92,21 +153,36 @@ def sanitize_filename(name):
     sanitized_name = sanitized_name.replace(' ', '_')
     return sanitized_name
 
-def fetch_pipelines(project_id):
+def parse_json_response(response):
+    """
+    Parse the JSON body of an API response, straight from the raw bytes with orjson when available.
+    """
+    if orjson is not None:
+        return orjson.loads(response.content)
+    return response.json()
+
+def get_next_page_url(response):
+    """
+    Return the URL of the next page from the Link header, or None on the last page.
+    """
+    match = NEXT_LINK_RE.search(response.headers.get('Link', ''))
+    return match.group(1) if match else None
+
+def fetch_pipelines(ctx):
     """
     Fetch all pipelines updated in the specified date range.
     Uses Link header for pagination (GitLab best practice).
     """
     pipelines = []
-    url = f"{GITLAB_URL}/api/v4/projects/{project_id}/pipelines"
+    url = f"{GITLAB_URL}/api/v4/projects/{ctx.project_id}/pipelines"
     params = {
         "updated_after": days_ago_iso,
         "per_page": 100,  # Maximum allowed by GitLab API
     }
 
     while url:
-        response = make_api_request_with_retry(url, params)
-        data = response.json()
+        response = make_api_request_with_retry(ctx, url, params)
+        data = parse_json_response(response)
 
         if not data:
             break
@@ -114,45 +190,51 @@ def fetch_pipelines(project_id):
         pipelines.extend(data)
 
         # Use Link header for next page
-        link_header = response.headers.get('Link', '')
-        next_url = None
-
-        for link in link_header.split(','):
-            if 'rel="next"' in link:
-                next_url = link[link.find('<') + 1:link.find('>')]
-                break
-
-        url = next_url
+        url = get_next_page_url(response)
         params = None  # URL from Link header already has params
 
     return pipelines
 
-def update_rate_limit_info(response):
+def update_rate_limit_info(ctx, response):
     """
-    Update global rate limit tracking from response headers.
+    Update the rate limit tracking of the context from response headers.
     """
-    global rate_limit_remaining, rate_limit_reset
+    rate_limit = ctx.rate_limit
 
     if 'RateLimit-Remaining' in response.headers:
-        rate_limit_remaining = int(response.headers['RateLimit-Remaining'])
+        rate_limit.remaining = int(response.headers['RateLimit-Remaining'])
 
-        if rate_limit_remaining < 100:
-            logging.warning(f"Rate limit warning: Only {rate_limit_remaining} requests remaining")
+        if rate_limit.remaining < 100:
+            logging.warning(f"Rate limit warning: Only {rate_limit.remaining} requests remaining")
 
     if 'RateLimit-Reset' in response.headers:
-        rate_limit_reset = int(response.headers['RateLimit-Reset'])
-
-def make_api_request_with_retry(url, params=None):
+        rate_limit.reset = int(response.headers['RateLimit-Reset'])
+
+    # Pause new requests until the window resets when the remaining budget is nearly used up
+    if rate_limit.remaining is not None and rate_limit.remaining < RATE_LIMIT_THROTTLE_THRESHOLD:
+        with rate_limit.lock:
+            if rate_limit.ok.is_set():
+                sleep_for = max(0, rate_limit.reset - time.time()) if rate_limit.reset else 60
+                logging.warning(f"Rate limit nearly exhausted: pausing new requests for {sleep_for:.0f} seconds")
+                rate_limit.ok.clear()
+                timer = threading.Timer(sleep_for, rate_limit.ok.set)
+                timer.daemon = True
+                timer.start()
+
+def make_api_request_with_retry(ctx, url, params=None):
     """
     Make an API request with exponential backoff retry logic.
     Monitors rate limits and handles 429 Too Many Requests.
     """
     for attempt in range(RETRY_ATTEMPTS):
         try:
-            response = requests.get(url, headers=headers, params=params, timeout=30)
+            # Wait while requests are paused by the rate limit throttle
+            ctx.rate_limit.ok.wait()
+            with request_slots:
+                response = session.get(url, params=params, timeout=30)
 
             # Update rate limit info
-            update_rate_limit_info(response)
+            update_rate_limit_info(ctx, response)
 
             # Handle rate limiting
             if response.status_code == 429:
@@ -175,13 +257,18 @@ def make_api_request_with_retry(url, params=None):
 
     raise requests.RequestException("Max retries exceeded")
 
-def fetch_pipeline_jobs(project_id, pipeline_id, include_retried=False):
+def fetch_pipeline_jobs(ctx, pipeline_id, include_retried=False):
     """
     Fetch all jobs for a specific pipeline with pagination.
-    Uses Link header for efficient pagination (GitLab best practice).
+    Pages after the first are fetched concurrently once X-Total-Pages is known,
+    otherwise the Link header is followed (GitLab best practice).
+
+    REST rather than a combined GraphQL pipelines { jobs } query: GitLab's query complexity
+    limit (250) multiplies across nested connections, so a page could only hold a few
+    pipelines with a few jobs each - more round trips than this endpoint, not fewer.
     """
     jobs = []
-    url = f"{GITLAB_URL}/api/v4/projects/{project_id}/pipelines/{pipeline_id}/jobs"
+    url = f"{GITLAB_URL}/api/v4/projects/{ctx.project_id}/pipelines/{pipeline_id}/jobs"
     params = {
         "per_page": 100,  # Maximum allowed by GitLab API
     }
@@ -189,9 +276,22 @@ def fetch_pipeline_jobs(project_id, pipeline_id, include_retried=False):
     if include_retried:
         params["include_retried"] = "true"
 
+    response = make_api_request_with_retry(ctx, url, params)
+    jobs.extend(parse_json_response(response))
+
+    # The first page tells how many pages there are: fetch the others concurrently
+    total_pages = int(response.headers.get('X-Total-Pages') or 0)
+    if total_pages > 1:
+        page_params = [dict(params, page=page) for page in range(2, total_pages + 1)]
+        for data in page_executor.map(lambda page_param: parse_json_response(make_api_request_with_retry(ctx, url, page_param)), page_params):
+            jobs.extend(data)
+        return jobs
+
+    # Page count unknown (GitLab omits it above 10,000 items): follow the Link header
+    url = get_next_page_url(response)
     while url:
-        response = make_api_request_with_retry(url, params)
-        data = response.json()
+        response = make_api_request_with_retry(ctx, url)
+        data = parse_json_response(response)
 
         if not data:
             break
@@ -199,16 +299,7 @@ def fetch_pipeline_jobs(project_id, pipeline_id, include_retried=False):
         jobs.extend(data)
 
         # Use Link header for next page (GitLab best practice)
-        link_header = response.headers.get('Link', '')
-        next_url = None
-
-        for link in link_header.split(','):
-            if 'rel="next"' in link:
-                next_url = link[link.find('<') + 1:link.find('>')]
-                break
-
-        url = next_url
-        params = None  # URL from Link header already has params
+        url = get_next_page_url(response)
 
     return jobs
 
@@ -226,31 +317,158 @@ def write_section_header(file, title, char="=", width=100):
     logging.info(title)
     logging.info(char * width + "\n")
 
-def fetch_pipeline_jobs_with_metadata(project_id, pipeline):
+def get_jobs_cache_path(project_id, pipeline):
+    """
+    Return the cache file for a pipeline's jobs, or None if the pipeline can still change.
+    The status and last update time are part of the key, so a pipeline retried since it was cached
+    is fetched again, even if it ended in the same status (e.g. failed, retried, failed again).
+    """
+    if not JOBS_CACHE_DIR or pipeline.get('status') not in TERMINAL_PIPELINE_STATUSES or not pipeline.get('updated_at'):
+        return None
+    updated_at = re.sub(r'\D', '', pipeline['updated_at'])  # e.g. 2025-04-01T12:00:00.000Z -> 20250401120000000
+    return os.path.join(JOBS_CACHE_DIR, f"{project_id}_{pipeline['id']}_{pipeline['status']}_{updated_at}.json")
+
+def read_cached_jobs(cache_path):
+    """
+    Return the cached jobs for a pipeline, or None if they are not cached.
+    """
+    if not cache_path:
+        return None
+    try:
+        with open(cache_path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_cached_jobs(cache_path, jobs):
+    """
+    Store the jobs of a pipeline in the cache (written atomically, as workers run concurrently).
+    """
+    if not cache_path:
+        return
+    try:
+        os.makedirs(JOBS_CACHE_DIR, exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(jobs, f)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        logging.warning(f"Could not cache jobs in {cache_path}: {e}")
+
+def parse_gitlab_datetime(value):
+    """
+    Parse a GitLab API timestamp (e.g. 2025-04-01T12:00:00.000Z) into an aware datetime.
+    """
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+def select_bulk_jobs_pipelines(all_pipelines, uncached_pipelines, cached_job_counts):
+    """
+    Choose the uncached pipelines whose jobs are cheaper to get from the project jobs listing.
+    The listing returns every job of the project newest first, down to the oldest chosen pipeline,
+    so only a cluster of recent pipelines pays off. Walking the pipelines newest first, each cluster
+    is priced in estimated listing pages (from the job counts of cached pipelines) against the
+    per-pipeline requests it replaces. Returns the uncached pipelines of the cluster saving the most
+    requests, or an empty list if none saves at least BULK_JOBS_MIN_SAVED_REQUESTS.
+    """
+    if cached_job_counts:
+        jobs_per_pipeline = sum(cached_job_counts.values()) / len(cached_job_counts)
+    else:
+        jobs_per_pipeline = DEFAULT_JOBS_PER_PIPELINE
+    uncached_ids = {pipeline['id'] for pipeline in uncached_pipelines}
+
+    # Pipelines created before the analysis period may be listed among jobs of pipelines we do not know of
+    cutoff = days_ago.astimezone()
+    recent_pipelines = [p for p in all_pipelines if parse_gitlab_datetime(p['created_at']) >= cutoff]
+    recent_pipelines.sort(key=lambda p: parse_gitlab_datetime(p['created_at']), reverse=True)
+
+    listed_jobs = 0
+    replaced_requests = 0
+    best_saving, best_count = 0, 0
+    for count, pipeline in enumerate(recent_pipelines, 1):
+        listed_jobs += cached_job_counts.get(pipeline['id'], jobs_per_pipeline)
+        if pipeline['id'] in uncached_ids:
+            replaced_requests += max(1, math.ceil(jobs_per_pipeline / 100))
+        # 100 jobs per page, plus the page reaching past the oldest pipeline
+        saving = replaced_requests - (math.ceil(listed_jobs / 100) + 1)
+        if saving > best_saving:
+            best_saving, best_count = saving, count
+
+    if best_saving < BULK_JOBS_MIN_SAVED_REQUESTS:
+        return []
+    return [p for p in recent_pipelines[:best_count] if p['id'] in uncached_ids]
+
+def fetch_recent_project_jobs(ctx, pipelines):
+    """
+    Fetch the jobs of many pipelines at once through the project jobs endpoint,
+    instead of one paginated request chain per pipeline.
+    The endpoint lists all jobs of the project (retried ones included) newest first,
+    so paging stops once a page reaches jobs created before the oldest pipeline.
+    Returns a dict of pipeline ID to its jobs.
+    """
+    pipeline_ids = {pipeline['id'] for pipeline in pipelines}
+    jobs_by_pipeline = {pipeline_id: [] for pipeline_id in pipeline_ids}
+    created_after = min(parse_gitlab_datetime(pipeline['created_at']) for pipeline in pipelines)
+
+    url = f"{GITLAB_URL}/api/v4/projects/{ctx.project_id}/jobs"
+    params = {
+        "per_page": 100,  # Maximum allowed by GitLab API
+    }
+
+    while url:
+        response = make_api_request_with_retry(ctx, url, params)
+        data = parse_json_response(response)
+
+        if not data:
+            break
+
+        for job in data:
+            pipeline_id = job['pipeline']['id']
+            if pipeline_id in pipeline_ids:
+                jobs_by_pipeline[pipeline_id].append(job)
+
+        # Jobs are created after their pipeline, so older pages hold none of ours
+        if parse_gitlab_datetime(data[-1]['created_at']) < created_after:
+            break
+
+        url = get_next_page_url(response)
+        params = None  # URL from Link header already has params
+
+    return jobs_by_pipeline
+
+def build_pipeline_result(pipeline, jobs, error=None):
+    """
+    Bundle the jobs of a pipeline with its metadata, or the error that prevented fetching them.
+    """
+    return {
+        'pipeline_id': pipeline['id'],
+        'pipeline': pipeline,
+        'jobs': jobs,
+        'success': error is None,
+        'error': error
+    }
+
+def fetch_pipeline_jobs_with_metadata(ctx, pipeline):
     """
     Fetch jobs for a pipeline and return with pipeline metadata.
+    Jobs of finished pipelines are stored in the on-disk cache.
     This function is designed to be called concurrently.
     """
-    pipeline_id = pipeline['id']
     try:
-        jobs = fetch_pipeline_jobs(project_id, pipeline_id, include_retried=True)
-        return {
-            'pipeline_id': pipeline_id,
-            'pipeline': pipeline,
-            'jobs': jobs,
-            'success': True,
-            'error': None
-        }
+        # Retried jobs are always needed: without them a flakey job (failed, then succeeded on
+        # retry) only shows its final success, so no cheaper first pass can rule out flakiness
+        jobs = fetch_pipeline_jobs(ctx, pipeline['id'], include_retried=True)
+        write_cached_jobs(get_jobs_cache_path(ctx.project_id, pipeline), jobs)
+        return build_pipeline_result(pipeline, jobs)
     except requests.RequestException as e:
-        return {
-            'pipeline_id': pipeline_id,
-            'pipeline': pipeline,
-            'jobs': [],
-            'success': False,
-            'error': str(e)
-        }
+        return build_pipeline_result(pipeline, [], str(e))
+
+def get_chronological_statuses(job_list):
+    """
+    Return the statuses of a job's attempts in chronological order (oldest first, by job ID).
+    """
+    return [job['status'] for job in sorted(job_list, key=lambda job: job['id'])]
 
-def analyze_flakiness_vs_legitimate_failures(project_id, pipelines):
+def analyze_flakiness_vs_legitimate_failures(ctx, pipelines):
     """
     Analyze job failures to distinguish between:
     1. Flakey tests: Jobs that failed but eventually succeeded on retry
@@ -276,20 +494,60 @@ def analyze_flakiness_vs_legitimate_failures(project_id, pipelines):
     # Track all flakey occurrences for detailed reporting
     flakey_details = []
 
-    total_count = len(pipelines)
+    # Jobs of skipped or never-started pipelines did not run, so they cannot be flakey or failing
+    # (they are still part of the project jobs listing)
+    all_pipelines = pipelines
+    ran_pipelines = [p for p in pipelines if p.get('status') not in NOT_RUN_PIPELINE_STATUSES]
+    if len(ran_pipelines) < len(pipelines):
+        logging.info(f"Skipping {len(pipelines) - len(ran_pipelines)} pipelines whose jobs did not run ({', '.join(sorted(NOT_RUN_PIPELINE_STATUSES))})")
+    pipelines = ran_pipelines
+
+    pipeline_results = []
+
+    # Jobs of finished pipelines are served from the on-disk cache when available
+    uncached_pipelines = []
+    cached_job_counts = {}
+    for pipeline in pipelines:
+        jobs = read_cached_jobs(get_jobs_cache_path(ctx.project_id, pipeline))
+        if jobs is None:
+            uncached_pipelines.append(pipeline)
+        else:
+            cached_job_counts[pipeline['id']] = len(jobs)
+            pipeline_results.append(build_pipeline_result(pipeline, jobs))
+
+    if pipeline_results:
+        logging.info(f"Loaded jobs for {len(pipeline_results)} pipelines from the cache")
+
+    # A cluster of recent pipelines gets its jobs from the project jobs listing, which pages
+    # through ~100 jobs per request instead of at least one request per pipeline
+    recent_pipelines = select_bulk_jobs_pipelines(all_pipelines, uncached_pipelines, cached_job_counts)
+    if recent_pipelines:
+        logging.info(f"Fetching jobs for {len(recent_pipelines)} recent pipelines from the project jobs listing...")
+        try:
+            jobs_by_pipeline = fetch_recent_project_jobs(ctx, recent_pipelines)
+            for pipeline in recent_pipelines:
+                jobs = jobs_by_pipeline[pipeline['id']]
+                write_cached_jobs(get_jobs_cache_path(ctx.project_id, pipeline), jobs)
+                pipeline_results.append(build_pipeline_result(pipeline, jobs))
+            recent_ids = set(jobs_by_pipeline)
+            uncached_pipelines = [p for p in uncached_pipelines if p['id'] not in recent_ids]
+        except requests.RequestException as e:
+            logging.warning(f"Project jobs listing failed ({e}), fetching jobs per pipeline instead")
+
+    total_count = len(uncached_pipelines)
     processed_count = 0
 
-    # Fetch jobs for all pipelines concurrently
+    # Fetch jobs for the remaining pipelines concurrently
     # Using MAX_WORKERS (8) optimized for GitLab API rate limits
+    # Threads rather than asyncio: the rate limits cap us at MAX_WORKERS requests in flight,
+    # which a handful of threads already saturates without an extra (aiohttp) dependency
     logging.info(f"Fetching jobs for {total_count} pipelines concurrently (max {MAX_WORKERS} workers)...")
 
-    pipeline_results = []
-
     with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
         # Submit all fetch jobs
         future_to_pipeline = {
-            executor.submit(fetch_pipeline_jobs_with_metadata, project_id, pipeline): pipeline
-            for pipeline in pipelines
+            executor.submit(fetch_pipeline_jobs_with_metadata, ctx, pipeline): pipeline
+            for pipeline in uncached_pipelines
         }
 
         # Process results as they complete
@@ -301,7 +559,7 @@ def analyze_flakiness_vs_legitimate_failures(project_id, pipelines):
             if processed_count % 10 == 0 or processed_count == total_count:
                 logging.info(f"Fetched jobs from {processed_count}/{total_count} pipelines")
 
-    logging.info(f"Successfully fetched jobs for {total_count} pipelines. Analyzing...")
+    logging.info(f"Successfully fetched jobs for {len(pipeline_results)} pipelines. Analyzing...")
 
     # Now analyze all the fetched data
     for result in pipeline_results:
@@ -320,66 +578,70 @@ def analyze_flakiness_vs_legitimate_failures(project_id, pipelines):
 
         # Analyze each job group to determine if it's flakey or legitimate failure
         for job_name, job_list in jobs_by_name.items():
-            # Sort by job ID to get chronological order (oldest first, newest last)
-            job_list.sort(key=lambda x: x['id'])
-
-            # Get statuses of all jobs in this group
-            statuses = [job['status'] for job in job_list]
-
-            # Count this job group
-            job_stats[job_name]['total_job_groups'] += 1
+            # Count this job group (looking up its statistics once)
+            stats = job_stats[job_name]
+            stats['total_job_groups'] += 1
 
             # Determine the number of attempts
             num_attempts = len(job_list)
             retry_count = num_attempts - 1
-            job_stats[job_name]['total_retry_attempts'] += retry_count
-
-            # Analyze the outcome pattern
-            has_success = 'success' in statuses
-            has_failure = 'failed' in statuses
+            stats['total_retry_attempts'] += retry_count
+
+            # Analyze the outcome pattern in one pass: combine the statuses of all attempts into flags
+            # and find the first attempt (lowest job ID), without sorting the group
+            status_flags = 0
+            first_job = job_list[0]
+            for job in job_list:
+                status_flags |= STATUS_FLAGS.get(job['status'], OTHER_STATUS_FLAG)
+                if job['id'] < first_job['id']:
+                    first_job = job
+            has_success = bool(status_flags & SUCCESS_FLAG)
+            has_failure = bool(status_flags & FAILED_FLAG)
 
             # Check for only other statuses (no success or failure)
             only_other_statuses = not has_success and not has_failure
 
-            if num_attempts == 1 and job_list[0]['status'] == 'success':
+            if num_attempts == 1 and first_job['status'] == 'success':
                 # Clean success: No retries needed, succeeded on first try
-                job_stats[job_name]['clean_successes'] += 1
+                stats['clean_successes'] += 1
                 logging.debug(f"Pipeline {pipeline_id}, Job '{job_name}': Clean success (no retries)")
 
             elif has_failure and has_success:
                 # FLAKEY TEST: Failed at least once but eventually succeeded
-                job_stats[job_name]['flakey_occurrences'] += 1
-                job_stats[job_name]['flakey_retry_attempts'] += retry_count
-                job_stats[job_name]['flakey_pipelines'].append(pipeline_id)
+                statuses = get_chronological_statuses(job_list)
+                stats['flakey_occurrences'] += 1
+                stats['flakey_retry_attempts'] += retry_count
+                stats['flakey_pipelines'].append(pipeline_id)
                 flakey_details.append({
                     'pipeline_id': pipeline_id,
                     'pipeline_ref': pipeline.get('ref', 'unknown'),
                     'job_name': job_name,
                     'num_attempts': num_attempts,
-                    'statuses': statuses
+                    'statuses': statuses,
+                    'status_str': ' → '.join(statuses)
                 })
                 logging.info(f"Pipeline {pipeline_id}, Job '{job_name}': FLAKEY (failed then succeeded), attempts: {num_attempts}, statuses: {statuses}")
 
             elif has_failure and not has_success:
                 # LEGITIMATE FAILURE: Failed and all retries also failed (bad code)
-                job_stats[job_name]['legitimate_failures'] += 1
-                job_stats[job_name]['legitimate_retry_attempts'] += retry_count
+                stats['legitimate_failures'] += 1
+                stats['legitimate_retry_attempts'] += retry_count
                 logging.debug(f"Pipeline {pipeline_id}, Job '{job_name}': LEGITIMATE FAILURE (all attempts failed), attempts: {num_attempts}")
 
             elif only_other_statuses:
                 # Other statuses: canceled, skipped, manual, running, etc.
-                job_stats[job_name]['other_statuses'] += 1
-                logging.debug(f"Pipeline {pipeline_id}, Job '{job_name}': Other statuses (no success/failure): {statuses}")
+                stats['other_statuses'] += 1
+                logging.debug(f"Pipeline {pipeline_id}, Job '{job_name}': Other statuses (no success/failure): {get_chronological_statuses(job_list)}")
 
             elif has_success and not has_failure and num_attempts > 1:
                 # Multiple attempts but all succeeded (shouldn't happen with retry: 2 logic, but handle it)
-                job_stats[job_name]['clean_successes'] += 1
-                logging.warning(f"Pipeline {pipeline_id}, Job '{job_name}': Unexpected - multiple attempts all succeeded: {statuses}")
+                stats['clean_successes'] += 1
+                logging.warning(f"Pipeline {pipeline_id}, Job '{job_name}': Unexpected - multiple attempts all succeeded: {get_chronological_statuses(job_list)}")
 
             else:
                 # Truly unexpected edge case
-                job_stats[job_name]['other_statuses'] += 1
-                logging.warning(f"Pipeline {pipeline_id}, Job '{job_name}': Unexpected status pattern: {statuses}")
+                stats['other_statuses'] += 1
+                logging.warning(f"Pipeline {pipeline_id}, Job '{job_name}': Unexpected status pattern: {get_chronological_statuses(job_list)}")
 
     logging.info(f"Flakiness analysis completed for {len(job_stats)} job types.")
     return job_stats, flakey_details
@@ -447,6 +709,8 @@ def write_flakiness_analysis_stats(file, job_stats, flakey_details):
     file.write(header)
     file.write("=" * 160 + "\n")
 
+    # Build the table rows and write them at once
+    job_rows = []
     for job_name, stats in sorted(job_stats.items()):
         total = stats['total_job_groups']
         clean = stats['clean_successes']
@@ -477,8 +741,9 @@ def write_flakiness_analysis_stats(file, job_stats, flakey_details):
             f"{flakiness_pct:<13.2f} "
             f"{reliability_pct:<15.2f}\n"
         )
-        file.write(line)
+        job_rows.append(line)
 
+    file.writelines(job_rows)
     file.write("\n")
 
     # Retry attempts breakdown
@@ -498,6 +763,7 @@ def write_flakiness_analysis_stats(file, job_stats, flakey_details):
     total_all_retries = 0
     total_flakey_retries = 0
     total_legit_retries = 0
+    retry_rows = []
 
     for job_name, stats in sorted(job_stats.items()):
         total_retries = stats['total_retry_attempts']
@@ -515,8 +781,9 @@ def write_flakiness_analysis_stats(file, job_stats, flakey_details):
                 f"{flakey_retries:<16} "
                 f"{legit_retries:<18}\n"
             )
-            file.write(line)
+            retry_rows.append(line)
 
+    file.writelines(retry_rows)
     file.write("=" * 150 + "\n")
     totals_line = (
         f"{'TOTALS':<40} "
@@ -541,41 +808,36 @@ def write_flakiness_analysis_stats(file, job_stats, flakey_details):
         job_name_width = max(len("Job Name"), max(len(str(d['job_name'])) for d in flakey_details))
         attempts_width = max(len("Attempts"), max(len(str(d['num_attempts'])) for d in flakey_details))
         # Calculate status pattern width
-        status_widths = [len(' → '.join(d['statuses'])) for d in flakey_details]
-        status_pattern_width = max(len("Status Pattern"), max(status_widths) if status_widths else 0)
+        status_pattern_width = max(len("Status Pattern"), max(len(d['status_str']) for d in flakey_details))
+
+        # Row format with the dynamic widths baked in, shared by the header and the data rows
+        row_format = (
+            f"{{pipeline_id:<{pipeline_id_width}}} "
+            f"{{pipeline_ref:<{branch_ref_width}}} "
+            f"{{job_name:<{job_name_width}}} "
+            f"{{num_attempts:<{attempts_width}}} "
+            f"{{status_str:<{status_pattern_width}}}\n"
+        )
 
         # Write header with dynamic widths
-        header_details = (
-            f"{'Pipeline ID':<{pipeline_id_width}} "
-            f"{'Branch/Ref':<{branch_ref_width}} "
-            f"{'Job Name':<{job_name_width}} "
-            f"{'Attempts':<{attempts_width}} "
-            f"{'Status Pattern':<{status_pattern_width}}\n"
-        )
-        file.write(header_details)
+        file.write(row_format.format(
+            pipeline_id='Pipeline ID', pipeline_ref='Branch/Ref', job_name='Job Name',
+            num_attempts='Attempts', status_str='Status Pattern'
+        ))
 
         # Calculate total width for separator line
         total_width = pipeline_id_width + branch_ref_width + job_name_width + attempts_width + status_pattern_width + 4
         file.write("=" * total_width + "\n")
 
         # Write data rows with same dynamic widths
-        for detail in flakey_details:
-            pipeline_url = f"https://gitlab.com/lifechurch/io/digital-product/interactions/lc-app/-/pipelines/{detail['pipeline_id']}"
-            status_str = ' → '.join(detail['statuses'])
-            line = (
-                f"{detail['pipeline_id']:<{pipeline_id_width}} "
-                f"{detail['pipeline_ref']:<{branch_ref_width}} "
-                f"{detail['job_name']:<{job_name_width}} "
-                f"{detail['num_attempts']:<{attempts_width}} "
-                f"{status_str:<{status_pattern_width}}\n"
-            )
-            file.write(line)
+        file.writelines(row_format.format_map(detail) for detail in flakey_details)
 
         file.write("\n")
         file.write("TIP: View these pipelines in GitLab to investigate why the tests failed initially:\n")
-        for detail in flakey_details:
-            pipeline_url = f"https://gitlab.com/lifechurch/io/digital-product/interactions/lc-app/-/pipelines/{detail['pipeline_id']}"
-            file.write(f"  - {pipeline_url}\n")
+        file.writelines(
+            f"  - https://gitlab.com/lifechurch/io/digital-product/interactions/lc-app/-/pipelines/{detail['pipeline_id']}\n"
+            for detail in flakey_details
+        )
         file.write("\n")
 
 def main():
@@ -585,20 +847,22 @@ def main():
     try:
         current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         all_generated_files = []
+        # The rate limit applies to the token, so its tracking carries over from one project to the next
+        rate_limit = RateLimitState()
 
         for project_id in PROJECT_IDS:
             # Initialization
-            global project_name, sanitized_project_name, output_filename
-            project_name = fetch_project_name(project_id)
-            setup_logging()
+            ctx = ProjectContext(project_id, rate_limit)
+            ctx.project_name = fetch_project_name(ctx)
+            setup_logging(ctx)
 
-            logging.info(f"Starting GitLab Flakiness Analysis for project: {project_name} (ID: {project_id})")
+            logging.info(f"Starting GitLab Flakiness Analysis for project: {ctx.project_name} (ID: {project_id})")
             logging.info(f"Analyzing data from the last {DAYS_AGO} days (since {days_ago.strftime('%Y-%m-%d')})")
-            logging.info(f"Results will be saved to {output_filename}")
+            logging.info(f"Results will be saved to {ctx.output_filename}")
 
             # Fetch pipelines
             logging.info("Fetching pipelines data...")
-            pipelines = fetch_pipelines(project_id)
+            pipelines = fetch_pipelines(ctx)
             pipeline_count = len(pipelines)
             logging.info(f"Found {pipeline_count} pipelines in the last {DAYS_AGO} days.")
 
@@ -607,9 +871,10 @@ def main():
                 continue
 
             # Open output file
-            with open(output_filename, "w") as output_file:
+            # Large buffer: the report is written in many small pieces
+            with open(ctx.output_filename, "w", buffering=1 << 20) as output_file:
                 # Write file header
-                output_file.write(f"# GitLab Flakiness Analysis Results for {project_name} (ID: {project_id})\n")
+                output_file.write(f"# GitLab Flakiness Analysis Results for {ctx.project_name} (ID: {project_id})\n")
                 output_file.write(f"# Generated on: {current_time}\n")
                 output_file.write(f"# Analysis period: Last {DAYS_AGO} days (since {days_ago.strftime('%Y-%m-%d')})\n")
                 output_file.write(f"# Total pipelines analyzed: {pipeline_count}\n\n")
@@ -631,30 +896,32 @@ def main():
                 output_file.write("   - Ideal scenario\n\n")
 
                 # Run flakiness analysis
-                job_stats, flakey_details = analyze_flakiness_vs_legitimate_failures(project_id, pipelines)
+                job_stats, flakey_details = analyze_flakiness_vs_legitimate_failures(ctx, pipelines)
                 write_flakiness_analysis_stats(output_file, job_stats, flakey_details)
 
-            logging.info(f"Analysis complete! Results saved to {output_filename}")
-            logging.info(f"Log file saved to {log_filename}")
-            all_generated_files.append(output_filename)
-            all_generated_files.append(log_filename)
+            logging.info(f"Analysis complete! Results saved to {ctx.output_filename}")
+            logging.info(f"Log file saved to {ctx.log_filename}")
+            all_generated_files.append(ctx.output_filename)
+            all_generated_files.append(ctx.log_filename)
 
         # Create a timestamped folder and zip the results
         if all_generated_files:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             folder_name = f"flakiness_analysis_results_{timestamp}"
 
-            os.makedirs(folder_name, exist_ok=True)
-            logging.info(f"Created directory: {folder_name}")
-
-            for file_path in all_generated_files:
-                if os.path.exists(file_path):
-                    shutil.move(file_path, os.path.join(folder_name, os.path.basename(file_path)))
+            # Close the log file so its last lines are archived; console logging continues
+            for handler in logging.root.handlers[:]:
+                if isinstance(handler, logging.FileHandler):
+                    logging.root.removeHandler(handler)
+                    handler.close()
 
-            logging.info(f"Moved all result files to {folder_name}")
+            # Write the result files straight into a compressed zip, removing each once archived
+            with zipfile.ZipFile(f"{folder_name}.zip", 'w', zipfile.ZIP_DEFLATED, compresslevel=6) as archive:
+                for file_path in all_generated_files:
+                    if os.path.exists(file_path):
+                        archive.write(file_path, arcname=os.path.basename(file_path))
+                        os.remove(file_path)
 
-            # Create a zip file of the folder
-            shutil.make_archive(folder_name, 'zip', folder_name)
             logging.info(f"Successfully created zip file: {folder_name}.zip")
 
     except requests.RequestException as e:
@@ -1,12 +1,23 @@
 import requests
 import logging
+import json
 import re
 import sys
 import os
-import shutil
 import zipfile
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+try:
+    import orjson  # Faster parsing of the API responses
+except ImportError:
+    orjson = None
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from collections import defaultdict
+from functools import lru_cache
+from operator import itemgetter
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 # GitLab project details
 # For each Gitlab Project you want to analyze, add its project ID to the PROJECT_IDS list
@@ -25,22 +36,69 @@ headers = {
     "Private-Token": ACCESS_TOKEN
 }
 
+# Number of pipelines whose details or jobs are fetched concurrently
+# The API calls are network bound, so threads overlap their round trips
+MAX_WORKERS = 16
+
+# Shared HTTP session: keep-alive connections to GitLab are reused instead of a new TCP+TLS handshake per request
+# Transient errors and rate limiting (429, honoring Retry-After) are retried with exponential backoff
+session = requests.Session()
+session.headers.update(headers)
+session.mount("https://", HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=64,
+    max_retries=Retry(total=5, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504], allowed_methods=["GET"])
+))
+
+# Threads fetching the duration and jobs of each pipeline, shared by all projects
+pipeline_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+
+# Number of pipelines whose jobs are fetched ahead of the job analysis (bounds the job lists held in memory)
+JOBS_FETCH_WINDOW = MAX_WORKERS * 2
+
+# Threads fetching the pages after the first of a list (separate from the per-pipeline workers,
+# which wait on these pages and would otherwise deadlock a shared pool)
+page_executor = ThreadPoolExecutor(max_workers=8)
+
+# On-disk cache of the details and jobs of pipelines in a terminal state, which no longer change
+# Set GITLAB_PIPELINE_CACHE_DIR to an empty string to disable
+PIPELINE_CACHE_DIR = os.environ.get("GITLAB_PIPELINE_CACHE_DIR", ".gitlab_pipeline_cache")
+TERMINAL_PIPELINE_STATUSES = {"success", "failed", "canceled", "skipped"}
+
+# Pipelines in these states have a duration (others have not run to completion)
+DURATION_PIPELINE_STATUSES = {"success", "failed", "canceled", "manual"}
+
 # Calculate date range (default 90 days)
 DAYS_AGO = 30
 days_ago = datetime.now() - timedelta(days=DAYS_AGO)
 days_ago_iso = days_ago.isoformat()
 
-# Global variables for output
-project_name = ""
-sanitized_project_name = ""
-output_filename = ""
-log_filename = ""
+# Progress of a pass over the pipelines is logged about this many times, however many pipelines there are
+PROGRESS_LOG_STEPS = 20
 
-def setup_logging():
+# Any character that is not alphanumeric, a space, or one of -_ (removed from filenames)
+SANITIZE_FILENAME_RE = re.compile(r'[^\w\s\-_]')
+
+@dataclass
+class ProjectContext:
+    # Project being analyzed and the names of its output files.
+    project_id: str
+    project_name: str = ""
+
+    @property
+    def sanitized_project_name(self):
+        return sanitize_filename(self.project_name)
+
+    @property
+    def output_filename(self):
+        return f"{self.sanitized_project_name}_pipeline_stats_results.txt"
+
+    @property
+    def log_filename(self):
+        return f"{self.sanitized_project_name}_pipeline_stats_log.txt"
+
+def setup_logging(ctx):
     # Configure logging to output to both console and file
-    global log_filename
-    log_filename = f"{sanitized_project_name}_pipeline_stats_log.txt"
-    
     # Clear previous handlers to avoid duplicates
     if logging.root.handlers:
         for handler in logging.root.handlers[:]:
@@ -50,83 +108,204 @@ def setup_logging():
         level=logging.INFO,
         format='%(asctime)s - %(levelname)s - %(message)s',
         handlers=[
-            logging.FileHandler(log_filename, mode='w'),  # Log to file
+            logging.FileHandler(ctx.log_filename, mode='w'),  # Log to file
             logging.StreamHandler()  # Log to console
         ]
     )
 
 def fetch_project_name(project_id):
     # Fetch the project name using the GitLab API.
-    global project_name, sanitized_project_name, output_filename
-    
     url = f"{GITLAB_URL}/api/v4/projects/{project_id}"
-    response = requests.get(url, headers=headers)
+    response = session.get(url, timeout=(5, 30))
     response.raise_for_status()
-    project_data = response.json()
-    project_name = project_data['name']
-    sanitized_project_name = sanitize_filename(project_name)
-    output_filename = f"{sanitized_project_name}_pipeline_stats_results.txt"
-    
-    return project_name
+    project_data = parse_json_response(response)
+    return project_data['name']
 
+@lru_cache(maxsize=None)
 def sanitize_filename(name):
     # Sanitize the project name to create a valid filename for logging.
     # Remove any character that is not alphanumeric, a space, or one of -_.
-    sanitized_name = re.sub(r'[^\w\s\-_]', '', name)
+    sanitized_name = SANITIZE_FILENAME_RE.sub('', name)
     # Replace spaces with underscores
     sanitized_name = sanitized_name.replace(' ', '_')
     return sanitized_name
 
-def fetch_pipelines(project_id):
-    # Fetch all pipelines updated in the specified date range.
-    pipelines = []
+def parse_json_response(response):
+    # Parse the JSON body of an API response, straight from the raw bytes with orjson when available.
+    if orjson is not None:
+        return orjson.loads(response.content)
+    return response.json()
+
+def fetch_page(url, params, page):
+    # Fetch a single page of a list endpoint.
+    response = session.get(url, params=dict(params, page=page), timeout=(5, 30))
+    response.raise_for_status()
+    return response
+
+def iter_pages(url, params):
+    # Yield the items of each page of a list endpoint, in page order.
+    response = fetch_page(url, params, 1)
+    data = parse_json_response(response)
+    yield data
+
+    # The first page tells how many pages there are: fetch the others concurrently
+    total_pages = int(response.headers.get('X-Total-Pages') or 0)
+    if total_pages:
+        yield from page_executor.map(lambda page: parse_json_response(fetch_page(url, params, page)), range(2, total_pages + 1))
+        return
+
+    # Page count unknown (GitLab omits it above 10,000 items): fetch pages one by one
+    # until X-Next-Page is empty (last page), or until an empty page if the header is missing
     page = 1
-    while True:
-        url = f"{GITLAB_URL}/api/v4/projects/{project_id}/pipelines"
-        params = {
-            "updated_after": days_ago_iso,
-            "per_page": 100,
-            "page": page
-        }
-        response = requests.get(url, headers=headers, params=params)
-        response.raise_for_status()
-        data = response.json()
-        if not data:
-            break
-        pipelines.extend(data)
+    while data and response.headers.get('X-Next-Page', str(page + 1)):
         page += 1
-    return pipelines
+        response = fetch_page(url, params, page)
+        data = parse_json_response(response)
+        yield data
+
+def iter_pipelines(project_id):
+    # Yield all pipelines updated in the specified date range, as their pages arrive.
+    # Offset pagination on purpose: GitLab offers no keyset pagination for project pipelines, and
+    # keyset pages could only be fetched one after another (each cursor comes from the previous page).
+    url = f"{GITLAB_URL}/api/v4/projects/{project_id}/pipelines"
+    params = {
+        "updated_after": days_ago_iso,
+        "per_page": 100
+    }
+    for data in iter_pages(url, params):
+        yield from data
 
 def fetch_pipeline_details(project_id, pipeline_id):
     # Fetch detailed information for a specific pipeline.
     url = f"{GITLAB_URL}/api/v4/projects/{project_id}/pipelines/{pipeline_id}"
-    response = requests.get(url, headers=headers)
+    response = session.get(url, timeout=(5, 30))
     response.raise_for_status()
-    return response.json()
+    return parse_json_response(response)
 
 def fetch_pipeline_jobs(project_id, pipeline_id, include_retried=False):
     # Fetch all jobs for a specific pipeline.
+    url = f"{GITLAB_URL}/api/v4/projects/{project_id}/pipelines/{pipeline_id}/jobs"
+    params = {
+        "per_page": 100
+    }
+
+    if include_retried:
+        params["include_retried"] = "true"
+
+    # Keep only the fields the analyses use: full job objects carry dozens of nested fields
+    # (user, commit, pipeline, runner, artifacts...) that would otherwise stay in memory and in the cache
     jobs = []
-    page = 1
-    while True:
-        url = f"{GITLAB_URL}/api/v4/projects/{project_id}/pipelines/{pipeline_id}/jobs"
-        params = {
-            "per_page": 100,
-            "page": page
-        }
-        
-        if include_retried:
-            params["include_retried"] = "true"
-            
-        response = requests.get(url, headers=headers, params=params)
-        response.raise_for_status()
-        data = response.json()
-        if not data:
-            break
-        jobs.extend(data)
-        page += 1
+    for data in iter_pages(url, params):
+        jobs.extend({'id': job['id'], 'name': job['name'], 'status': job['status'], 'duration': job.get('duration')} for job in data)
+    return jobs
+
+def get_pipeline_cache_path(project_id, pipeline, kind):
+    # Return the cache file for data of a pipeline ("details" or "jobs"), or None if the pipeline can still change.
+    # The status and last update time are part of the key, so a pipeline retried since it was cached is fetched
+    # again, even if it ended in the same status (e.g. failed, retried, failed again).
+    if not PIPELINE_CACHE_DIR or pipeline.get('status') not in TERMINAL_PIPELINE_STATUSES or not pipeline.get('updated_at'):
+        return None
+    updated_at = re.sub(r'\D', '', pipeline['updated_at'])  # e.g. 2025-04-01T12:00:00.000Z -> 20250401120000000
+    return os.path.join(PIPELINE_CACHE_DIR, f"{project_id}_{pipeline['id']}_{pipeline['status']}_{updated_at}_{kind}.json")
+
+def read_pipeline_cache(cache_path):
+    # Return the cached data, or None if it is not cached.
+    if not cache_path:
+        return None
+    try:
+        with open(cache_path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_pipeline_cache(cache_path, data):
+    # Store data in the cache (written atomically, as workers run concurrently).
+    if not cache_path:
+        return
+    try:
+        os.makedirs(PIPELINE_CACHE_DIR, exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        logging.warning(f"Could not cache pipeline data in {cache_path}: {e}")
+
+def fetch_pipeline_details_cached(project_id, pipeline):
+    # Fetch detailed information for a pipeline, from the cache when it is finished.
+    cache_path = get_pipeline_cache_path(project_id, pipeline, "details")
+    details = read_pipeline_cache(cache_path)
+    if details is None:
+        details = fetch_pipeline_details(project_id, pipeline['id'])
+        # Only cache details matching the listed pipeline (it may have been retried since it was listed)
+        if details.get('status') == pipeline['status'] and details.get('updated_at') == pipeline['updated_at']:
+            write_pipeline_cache(cache_path, details)
+    return details
+
+def fetch_pipeline_jobs_cached(project_id, pipeline):
+    # Fetch all jobs of a pipeline (retried jobs included), from the cache when it is finished.
+    cache_path = get_pipeline_cache_path(project_id, pipeline, "jobs")
+    jobs = read_pipeline_cache(cache_path)
+    if jobs is None:
+        jobs = fetch_pipeline_jobs(project_id, pipeline['id'], include_retried=True)
+        write_pipeline_cache(cache_path, jobs)
     return jobs
 
+def get_pipeline_duration(project_id, pipeline):
+    # Return the duration of a pipeline in seconds, or None if it is not available.
+    # Newer GitLab versions include it in the pipeline list, otherwise it comes from the pipeline details.
+    if pipeline.get('duration') is not None:
+        return pipeline['duration']
+    if pipeline.get('status') not in DURATION_PIPELINE_STATUSES:
+        return None
+    return fetch_pipeline_details_cached(project_id, pipeline).get('duration')
+
+def submit_pipeline_fetches(project_id):
+    # List the pipelines, submitting the fetch of the duration of each as soon as it is listed,
+    # so they are fetched while the later pages of the list load.
+    # Returns the pipelines and the futures of their durations, each mapped to its pipeline.
+    pipelines = []
+    duration_futures = {}
+    for pipeline in iter_pipelines(project_id):
+        pipelines.append(pipeline)
+        duration_futures[pipeline_executor.submit(get_pipeline_duration, project_id, pipeline)] = pipeline
+    return pipelines, duration_futures
+
+def iter_pipeline_jobs(project_id, pipelines):
+    # Yield (pipeline ID, jobs) for each pipeline as soon as its jobs (retried jobs included) are fetched.
+    # Pipelines whose jobs could not be fetched are left out.
+    # At most JOBS_FETCH_WINDOW fetches are pending at a time, refilled as the jobs are consumed,
+    # so only the jobs of those pipelines are held in memory, however many pipelines there are.
+    pending = {}
+    remaining_pipelines = iter(pipelines)
+    processed_count = 0
+    total_count = len(pipelines)
+
+    while True:
+        for pipeline in islice(remaining_pipelines, JOBS_FETCH_WINDOW - len(pending)):
+            pending[pipeline_executor.submit(fetch_pipeline_jobs_cached, project_id, pipeline)] = pipeline['id']
+        if not pending:
+            return
+
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            pipeline_id = pending.pop(future)
+            try:
+                jobs = future.result()
+            except requests.RequestException as e:
+                logging.error(f"Failed to fetch jobs for pipeline ID {pipeline_id}: {e}")
+                continue
+
+            processed_count += 1
+            if is_progress_step(processed_count, total_count):
+                logging.info(f"Fetched jobs from {processed_count}/{total_count} pipelines")
+
+            yield pipeline_id, jobs
+
+def is_progress_step(processed_count, total_count):
+    # Return whether to log the progress after processing processed_count of total_count items.
+    return processed_count % max(total_count // PROGRESS_LOG_STEPS, 1) == 0 or processed_count == total_count
+
 def write_section_header(file, title, char="=", width=100):
     # Write a formatted section header to the output file
     file.write("\n")
@@ -143,165 +322,122 @@ def write_section_header(file, title, char="=", width=100):
 # ANALYSIS FUNCTIONS
 #
 
-def analyze_pipeline_runtimes(project_id, pipelines):
+def add_duration(duration_stats, key, duration):
+    # Fold a duration into the running slowest/fastest/total statistics of key (no per-duration list is kept).
+    stats = duration_stats.get(key)
+    if stats is None:
+        duration_stats[key] = {"slowest": duration, "fastest": duration, "total": duration, "count": 1}
+        return
+    if duration > stats["slowest"]:
+        stats["slowest"] = duration
+    if duration < stats["fastest"]:
+        stats["fastest"] = duration
+    stats["total"] += duration
+    stats["count"] += 1
+
+def summarize_durations(duration_stats):
+    # Turn running duration statistics into the slowest/fastest/average statistics of each key.
+    return {
+        key: {
+            "slowest": stats["slowest"],
+            "fastest": stats["fastest"],
+            "average": stats["total"] / stats["count"]
+        }
+        for key, stats in duration_stats.items()
+    }
+
+def analyze_pipeline_runtimes(duration_futures):
     # Analyze pipeline runtimes grouped by branch.
+    # Takes the futures of the pipeline durations mapped to their pipelines (see submit_pipeline_fetches).
     logging.info("Starting pipeline runtime analysis...")
     
-    # Dictionary to store durations for each branch
-    branch_durations = defaultdict(list)
+    # Running duration statistics for each branch
+    branch_durations = {}
     processed_count = 0
-    total_count = len(pipelines)
+    total_count = len(duration_futures)
 
-    for pipeline in pipelines:
+    # In listing order rather than completion order: the sums (and so the rounded averages) do not vary between runs
+    # Most durations are already fetched by now, while the jobs were analyzed
+    for future, pipeline in duration_futures.items():
         pipeline_id = pipeline['id']
         ref = pipeline['ref']
-        
-        # Fetch detailed pipeline information
+
         try:
-            details = fetch_pipeline_details(project_id, pipeline_id)
-            duration = details.get('duration')  # Duration in seconds
+            duration = future.result()  # Duration in seconds
 
             if duration is not None:
                 duration_minutes = duration / 60
-                branch_durations[ref].append(duration_minutes)
-                logging.debug(f"Pipeline ID: {pipeline_id}, Branch: {ref}, Duration: {duration_minutes:.2f} minutes")
+                add_duration(branch_durations, ref, duration_minutes)
+                logging.debug("Pipeline ID: %s, Branch: %s, Duration: %.2f minutes", pipeline_id, ref, duration_minutes)
             else:
-                logging.debug(f"Pipeline ID: {pipeline_id}, Branch: {ref}, Duration: Not Available")
+                logging.debug("Pipeline ID: %s, Branch: %s, Duration: Not Available", pipeline_id, ref)
                 
             processed_count += 1
-            if processed_count % 10 == 0 or processed_count == total_count:
+            if is_progress_step(processed_count, total_count):
                 logging.info(f"Processed {processed_count}/{total_count} pipelines")
                 
         except requests.RequestException as e:
             logging.error(f"Error fetching details for pipeline {pipeline_id}: {e}")
 
     # Calculate statistics for each branch
-    branch_stats = {}
-    for branch, durations in branch_durations.items():
-        if durations:
-            slowest = max(durations)
-            fastest = min(durations)
-            average = sum(durations) / len(durations)
-            branch_stats[branch] = {
-                "slowest": slowest,
-                "fastest": fastest,
-                "average": average
-            }
+    branch_stats = summarize_durations(branch_durations)
 
     logging.info(f"Pipeline runtime analysis completed for {len(branch_stats)} branches.")
     return branch_stats
 
-def analyze_job_durations(project_id, all_jobs):
-    # Analyze job durations and calculate statistics.
-    logging.info("Starting job duration analysis...")
-    
-    job_durations = defaultdict(list)
-    for job in all_jobs:
-        duration = job.get('duration')  # Duration in seconds
-        if duration is not None:
-            job_durations[job['name']].append(duration / 60)  # Convert to minutes
-
-    job_stats = {}
-    for job_name, durations in job_durations.items():
-        if durations:
-            slowest = max(durations)
-            fastest = min(durations)
-            average = sum(durations) / len(durations)
-            job_stats[job_name] = {
-                "slowest": slowest,
-                "fastest": fastest,
-                "average": average
-            }
-            
-    logging.info(f"Job duration analysis completed for {len(job_stats)} job types.")
-    return job_stats
-
-def analyze_job_retries(project_id, pipelines):
-    # Analyze job retries and calculate Pipeline Reliability Rate.
-    logging.info("Starting job retry analysis...")
-    
-    job_stats = defaultdict(lambda: {'total_runs': 0, 'successes': 0, 'failures': 0, 'retries': 0})
-    processed_count = 0
-    total_count = len(pipelines)
-
-    for pipeline in pipelines:
-        pipeline_id = pipeline['id']
-        try:
-            jobs = fetch_pipeline_jobs(project_id, pipeline_id, include_retried=True)
-
-            # Group jobs by their name within the same pipeline
-            jobs_by_name = defaultdict(list)
-            for job in jobs:
-                jobs_by_name[job['name']].append(job)
-
-            # Analyze each group to determine retries and calculate statistics
-            for job_name, job_list in jobs_by_name.items():
-                job_list.sort(key=lambda x: x['id'], reverse=True)
-                latest_job = job_list[0]
-                retried_jobs = job_list[1:]
-
-                job_stats[job_name]['total_runs'] += len(job_list)
-                job_stats[job_name]['retries'] += len(retried_jobs)
-                for job in job_list:
-                    if job['status'] == 'success':
-                        job_stats[job_name]['successes'] += 1
-                    elif job['status'] == 'failed':
-                        job_stats[job_name]['failures'] += 1
-                        
-            processed_count += 1
-            if processed_count % 10 == 0 or processed_count == total_count:
-                logging.info(f"Processed {processed_count}/{total_count} pipelines for retry analysis")
-                
-        except requests.RequestException as e:
-            logging.error(f"Error fetching jobs for pipeline {pipeline_id}: {e}")
-
-    logging.info(f"Job retry analysis completed for {len(job_stats)} job types.")
-    return job_stats
-
-def analyze_retry_durations(project_id, pipelines):
-    # Analyze durations of retried jobs.
-    logging.info("Starting retry duration analysis...")
+def analyze_jobs(project_id, pipeline_jobs):
+    # Analyze job durations, job retries (Pipeline Reliability Rate) and durations of retried jobs
+    # in a single pass over the jobs of each pipeline, given as (pipeline ID, jobs) pairs.
+    # The jobs of each pipeline are folded into running totals and not kept.
+    # Job durations only count the latest attempt of each job in a pipeline (retried attempts are excluded).
+    logging.info("Starting job analysis...")
     
+    job_durations = {}
+    job_retry_stats = defaultdict(lambda: {'total_runs': 0, 'successes': 0, 'failures': 0, 'retries': 0})
     retried_jobs_duration = defaultdict(float)
     retried_jobs_count = defaultdict(int)
     total_retried_jobs = 0
-    processed_count = 0
-    total_count = len(pipelines)
 
-    for pipeline in pipelines:
-        pipeline_id = pipeline['id']
-        try:
-            jobs = fetch_pipeline_jobs(project_id, pipeline_id, include_retried=True)
+    for pipeline_id, jobs in pipeline_jobs:
+        # Group jobs by their name within the same pipeline
+        jobs_by_name = defaultdict(list)
+        for job in jobs:
+            jobs_by_name[job['name']].append(job)
 
-            # Group jobs by their name within the same pipeline
-            jobs_by_name = defaultdict(list)
-            for job in jobs:
-                jobs_by_name[job['name']].append(job)
+        # Analyze each group to determine retries and calculate statistics
+        for job_name, job_list in jobs_by_name.items():
+            # The latest job has the highest job ID, all the others are retries
+            latest_job = max(job_list, key=itemgetter('id'))
+            retried_jobs = [job for job in job_list if job is not latest_job]
 
-            # Analyze each group to determine retries and calculate statistics
-            for job_name, job_list in jobs_by_name.items():
-                # Sort by job ID to get the latest job first
-                job_list.sort(key=lambda x: x['id'], reverse=True)
-                
-                # If we have more than one job with the same name in a pipeline, we have retries
-                if len(job_list) > 1:
-                    retried_jobs = job_list[1:]  # All except the latest one are retries
-                    for job in retried_jobs:
-                        duration = job.get('duration')
-                        if duration is not None:
-                            retried_jobs_duration[job_name] += duration / 60  # Convert to minutes
-                            retried_jobs_count[job_name] += 1
-                            total_retried_jobs += 1
-                            logging.debug(f"Found retried job: {job_name} in pipeline {pipeline_id}, duration: {duration / 60:.2f} min")
-            
-            processed_count += 1
-            if processed_count % 10 == 0 or processed_count == total_count:
-                logging.info(f"Processed {processed_count}/{total_count} pipelines for retry duration analysis")
-                
-        except requests.RequestException as e:
-            logging.error(f"Error fetching jobs for pipeline {pipeline_id}: {e}")
-
-    # Calculate average durations
+            # Job duration of the latest attempt
+            duration = latest_job.get('duration')  # Duration in seconds
+            if duration is not None:
+                add_duration(job_durations, job_name, duration / 60)  # Convert to minutes
+
+            # Runs, outcomes and retries
+            stats = job_retry_stats[job_name]
+            stats['total_runs'] += len(job_list)
+            stats['retries'] += len(retried_jobs)
+            for job in job_list:
+                if job['status'] == 'success':
+                    stats['successes'] += 1
+                elif job['status'] == 'failed':
+                    stats['failures'] += 1
+
+            # Durations of the retried attempts
+            for job in retried_jobs:
+                duration = job.get('duration')
+                if duration is not None:
+                    retried_jobs_duration[job_name] += duration / 60  # Convert to minutes
+                    retried_jobs_count[job_name] += 1
+                    total_retried_jobs += 1
+                    logging.debug("Found retried job: %s in pipeline %s, duration: %.2f min", job_name, pipeline_id, duration / 60)
+
+    # Calculate duration statistics
+    job_stats = summarize_durations(job_durations)
+
+    # Calculate average durations of retried jobs
     retry_stats = {}
     for job_name in retried_jobs_duration:
         total_duration = retried_jobs_duration[job_name]
@@ -313,74 +449,76 @@ def analyze_retry_durations(project_id, pipelines):
             "avg_duration": avg_duration
         }
 
-    logging.info(f"Retry duration analysis completed with {total_retried_jobs} total retried jobs.")
-    return retry_stats, total_retried_jobs
+    logging.info(f"Job analysis completed for {len(job_retry_stats)} job types with {total_retried_jobs} total retried jobs.")
+    return job_stats, job_retry_stats, retry_stats, total_retried_jobs
 
 #
 # OUTPUT FUNCTIONS
 #
 
+# Row formatters of the output tables (templates parsed once, not per row)
+format_branch_row = "{:<50} {:<15.2f} {:<15.2f} {:<15.2f}\n".format
+format_job_duration_row = "{:<30} {:<15.2f} {:<15.2f} {:<15.2f}\n".format
+format_job_retry_row = "{:<30} {:<12} {:<10} {:<10} {:<8} {:<16.2f}\n".format
+format_retry_duration_row = "{:<30} {:<25.2f} {:<15} {:<20.2f}\n".format
+
 def write_branch_stats(file, branch_stats):
     # Write branch statistics to the output file.
     header = f"{'Branch':<50} {'Slowest (min)':<15} {'Fastest (min)':<15} {'Average (min)':<15}\n"
-    file.write(header)
-    file.write("=" * 95 + "\n")
-    
-    for branch, data in sorted(branch_stats.items()):
-        line = f"{branch:<50} {data['slowest']:<15.2f} {data['fastest']:<15.2f} {data['average']:<15.2f}\n"
-        file.write(line)
-        
-    file.write("\n")
+    rows = [header, "=" * 95 + "\n"]
+    rows.extend(
+        format_branch_row(branch, data['slowest'], data['fastest'], data['average'])
+        for branch, data in sorted(branch_stats.items())
+    )
+    rows.append("\n")
+    file.write("".join(rows))
 
 def write_job_duration_stats(file, job_stats):
     # Write job duration statistics to the output file.
     header = f"{'Job Name':<30} {'Slowest (min)':<15} {'Fastest (min)':<15} {'Average (min)':<15}\n"
-    file.write(header)
-    file.write("=" * 75 + "\n")
-    
-    for job_name, stats in sorted(job_stats.items()):
-        line = f"{job_name:<30} {stats['slowest']:<15.2f} {stats['fastest']:<15.2f} {stats['average']:<15.2f}\n"
-        file.write(line)
-        
-    file.write("\n")
+    rows = [header, "=" * 75 + "\n"]
+    rows.extend(
+        format_job_duration_row(job_name, stats['slowest'], stats['fastest'], stats['average'])
+        for job_name, stats in sorted(job_stats.items())
+    )
+    rows.append("\n")
+    file.write("".join(rows))
 
 def write_job_retry_stats(file, job_stats):
     # Write job retry statistics to the output file.
     header = f"{'Job Name':<30} {'Total Runs':<12} {'Successes':<10} {'Failures':<10} {'Retries':<8} {'Pipeline Reliability Rate (%)':<16}\n"
-    file.write(header)
-    file.write("=" * 85 + "\n")
+    rows = [header, "=" * 85 + "\n"]
     
     for job_name, stats in sorted(job_stats.items()):
         if stats['total_runs'] > 0:
             reliability_rate = ((stats['total_runs'] - stats['retries']) / stats['total_runs']) * 100
         else:
             reliability_rate = 0.0
-        line = f"{job_name:<30} {stats['total_runs']:<12} {stats['successes']:<10} {stats['failures']:<10} {stats['retries']:<8} {reliability_rate:<16.2f}\n"
-        file.write(line)
+        rows.append(format_job_retry_row(job_name, stats['total_runs'], stats['successes'], stats['failures'], stats['retries'], reliability_rate))
         
-    file.write("\n")
+    rows.append("\n")
+    file.write("".join(rows))
 
 def write_retry_duration_stats(file, retry_stats, total_retried_jobs):
     # Write retry duration statistics to the output file.
     header = f"{'Job Name':<30} {'Total Retried Duration (min)':<25} {'Retry Count':<15} {'Avg Duration (min)':<20}\n"
-    file.write(header)
-    file.write("=" * 90 + "\n")
+    rows = [header, "=" * 90 + "\n"]
     
     total_duration = 0
     
     if retry_stats:
         for job_name, stats in sorted(retry_stats.items()):
             total_duration += stats['total_duration']
-            line = f"{job_name:<30} {stats['total_duration']:<25.2f} {stats['count']:<15} {stats['avg_duration']:<20.2f}\n"
-            file.write(line)
+            rows.append(format_retry_duration_row(job_name, stats['total_duration'], stats['count'], stats['avg_duration']))
         
         # Add a total line
         total_line = f"{'TOTAL':<30} {total_duration:<25.2f} {total_retried_jobs:<15} {'-':<20}\n"
-        file.write(total_line)
+        rows.append(total_line)
     else:
-        file.write("No retried jobs found in the specified time frame.\n")
+        rows.append("No retried jobs found in the specified time frame.\n")
         
-    file.write("\n")
+    rows.append("\n")
+    file.write("".join(rows))
 
 def main():
     # Main function that runs all analyses in sequence
@@ -390,17 +528,18 @@ def main():
         
         for project_id in PROJECT_IDS:
             # Initialization
-            global project_name, sanitized_project_name, output_filename
-            project_name = fetch_project_name(project_id)
-            setup_logging()
+            ctx = ProjectContext(project_id)
+            ctx.project_name = fetch_project_name(project_id)
+            setup_logging(ctx)
             
-            logging.info(f"Starting unified GitLab Pipeline analysis for project: {project_name} (ID: {project_id})")
+            logging.info(f"Starting unified GitLab Pipeline analysis for project: {ctx.project_name} (ID: {project_id})")
             logging.info(f"Analyzing data from the last {DAYS_AGO} days (since {days_ago.strftime('%Y-%m-%d')})")
-            logging.info(f"Results will be saved to {output_filename}")
+            logging.info(f"Results will be saved to {ctx.output_filename}")
             
             # Fetch pipelines (we'll reuse this for all analyses)
+            # The duration of each pipeline is fetched in the background as soon as it is listed
             logging.info("Fetching pipelines data...")
-            pipelines = fetch_pipelines(project_id)
+            pipelines, duration_futures = submit_pipeline_fetches(project_id)
             pipeline_count = len(pipelines)
             logging.info(f"Found {pipeline_count} pipelines in the last {DAYS_AGO} days.")
             
@@ -409,45 +548,34 @@ def main():
                 continue
             
             # Open output file
-            with open(output_filename, "w") as output_file:
+            # Large buffer: the report is written in many small pieces
+            with open(ctx.output_filename, "w", buffering=1 << 20) as output_file:
                 # Write file header
-                output_file.write(f"# GitLab Pipeline Analysis Results for {project_name} (ID: {project_id})\n")
+                output_file.write(f"# GitLab Pipeline Analysis Results for {ctx.project_name} (ID: {project_id})\n")
                 output_file.write(f"# Generated on: {current_time}\n")
                 output_file.write(f"# Analysis period: Last {DAYS_AGO} days (since {days_ago.strftime('%Y-%m-%d')})\n")
                 output_file.write(f"# Total pipelines analyzed: {pipeline_count}\n\n")
                 
+                # Fetch the jobs of every pipeline once (retried jobs included) and analyze them in one pass,
+                # pipeline by pipeline as they arrive, while the remaining durations are fetched in the background
+                logging.info("Fetching jobs data...")
+                job_stats, job_retry_stats, retry_stats, total_retried_jobs = analyze_jobs(project_id, iter_pipeline_jobs(project_id, pipelines))
+
                 # ANALYSIS 1: Pipeline Runtimes by Branch
                 write_section_header(output_file, "1. PIPELINE RUNTIMES BY BRANCH")
-                branch_stats = analyze_pipeline_runtimes(project_id, pipelines)
+                branch_stats = analyze_pipeline_runtimes(duration_futures)
                 write_branch_stats(output_file, branch_stats)
-                
+
                 # ANALYSIS 2: Job Durations
                 write_section_header(output_file, "2. JOB DURATIONS")
-                
-                # Fetch all jobs for regular duration analysis
-                logging.info("Fetching jobs data for duration analysis...")
-                all_jobs = []
-                for i, pipeline in enumerate(pipelines):
-                    pipeline_id = pipeline['id']
-                    try:
-                        jobs = fetch_pipeline_jobs(project_id, pipeline_id, include_retried=False)
-                        all_jobs.extend(jobs)
-                        if (i + 1) % 10 == 0 or (i + 1) == pipeline_count:
-                            logging.info(f"Fetched jobs from {i+1}/{pipeline_count} pipelines")
-                    except requests.RequestException as e:
-                        logging.error(f"Failed to fetch jobs for pipeline ID {pipeline_id}: {e}")
-                
-                job_stats = analyze_job_durations(project_id, all_jobs)
                 write_job_duration_stats(output_file, job_stats)
                 
                 # ANALYSIS 3: Job Retries and Reliability
                 write_section_header(output_file, "3. JOB RETRIES AND RELIABILITY")
-                job_retry_stats = analyze_job_retries(project_id, pipelines)
                 write_job_retry_stats(output_file, job_retry_stats)
                 
                 # ANALYSIS 4: Retry Durations
                 write_section_header(output_file, "4. RETRY DURATIONS")
-                retry_stats, total_retried_jobs = analyze_retry_durations(project_id, pipelines)
                 write_retry_duration_stats(output_file, retry_stats, total_retried_jobs)
                 
                 # Final summary
@@ -464,27 +592,30 @@ def main():
                     overall_reliability = ((total_runs - total_retries) / total_runs) * 100
                     output_file.write(f"Overall pipeline reliability rate: {overall_reliability:.2f}%\n")
                     
-            logging.info(f"Analysis complete! Results saved to {output_filename}")
-            logging.info(f"Log file saved to {log_filename}")
-            all_generated_files.append(output_filename)
-            all_generated_files.append(log_filename)
+            logging.info(f"Analysis complete! Results saved to {ctx.output_filename}")
+            logging.info(f"Log file saved to {ctx.log_filename}")
+            all_generated_files.append(ctx.output_filename)
+            all_generated_files.append(ctx.log_filename)
 
         # Create a timestamped folder and zip the results
         if all_generated_files:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             folder_name = f"pipeline_audit_results_{timestamp}"
             
-            os.makedirs(folder_name, exist_ok=True)
-            logging.info(f"Created directory: {folder_name}")
-
-            for file_path in all_generated_files:
-                if os.path.exists(file_path):
-                    shutil.move(file_path, os.path.join(folder_name, os.path.basename(file_path)))
-            
-            logging.info(f"Moved all result files to {folder_name}")
+            # Close the log file so its last lines are archived; console logging continues
+            for handler in logging.root.handlers[:]:
+                if isinstance(handler, logging.FileHandler):
+                    logging.root.removeHandler(handler)
+                    handler.close()
+
+            # Write the result files straight into a zip, removing each once archived
+            # Level 1 compresses the text files nearly as well as the default, for much less CPU
+            with zipfile.ZipFile(f"{folder_name}.zip", 'w', zipfile.ZIP_DEFLATED, compresslevel=1) as archive:
+                for file_path in all_generated_files:
+                    if os.path.exists(file_path):
+                        archive.write(file_path, arcname=os.path.basename(file_path))
+                        os.remove(file_path)
 
-            # Create a zip file of the folder
-            shutil.make_archive(folder_name, 'zip', folder_name)
             logging.info(f"Successfully created zip file: {folder_name}.zip")
             
     except requests.RequestException as e: